@@ -1,16 +1,81 @@
+import asyncio
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
+import re
+import threading
+import time
+from typing import NamedTuple
 from dotenv import load_dotenv
-from langgraph.prebuilt import create_react_agent
-from tool import get_taker_data
-from tool import analyze_sentiment
+from tool import analyze_window, fetch_abort, get_taker_data_many, live_taker_data, window_results
+from jobs import JOB_TIMEOUT, get_job_queue, job_progress
+from cache import TTLCache, ttl_for_window
+from metrics import Counter, Histogram, record, stage
 load_dotenv()
-api_key = os.getenv("GOOGLE_API_KEY")
-os.environ["GOOGLE_API_KEY"] = api_key
-# Set up the API key
-#genai.configure(api_key=GOOGLE_API_KEY)
 
-model = ChatGoogleGenerativeAI(model="gemini-2.5-flash")
+# The model and the LangGraph agent are built on first use (see get_agent):
+# importing them is slow, and the fast path never needs them
+_model = None
+_agent = None
+_agent_lock = threading.Lock()
+
+DEFAULT_WHALE_THRESHOLD = 100000
+
+# "local": analyses run in this process; "queue": they are handed to
+# worker.py processes through the SQLite job queue (see jobs.py)
+ANALYSIS_BACKEND = os.getenv("ANALYSIS_BACKEND", "local")
+
+# Cached analyzer results, keyed on (symbol, window seconds, whale threshold)
+analysis_cache = TTLCache(maxsize=256)
+
+LLM_SECONDS = Histogram("llm_request_seconds", "Latency of LLM calls", ["kind", "outcome"])
+LLM_TOKENS = Counter("llm_tokens_total", "LLM tokens used", ["kind", "direction"])
+
+UNIT_SECONDS = {"m": 60, "h": 3600, "d": 86400, "w": 604800}
+QUERY_RE = re.compile(
+    r"^\s*([A-Z0-9]{5,20})\s+(\d+)\s*(m|mins?|minutes?|h|hrs?|hours?|d|days?|w|weeks?)"
+    r"(?:\s+whale(?:\s+threshold)?\s+\$?(\d+(?:\.\d+)?)(k|m)?)?\s*$",
+    re.IGNORECASE,
+)
+WINDOW_RE = re.compile(r"^\s*(\d+)\s*(m|mins?|minutes?|h|hrs?|hours?|d|days?|w|weeks?)\s*$", re.IGNORECASE)
+
+
+class ParsedQuery(NamedTuple):
+    symbol: str
+    seconds: int
+    whale_threshold: float = DEFAULT_WHALE_THRESHOLD
+
+    def window(self):
+        """Split the window into the analyzer's (days, hours, minutes)."""
+        days, rest = divmod(self.seconds, 86400)
+        hours, rest = divmod(rest, 3600)
+        return days, hours, rest // 60
+
+
+def parse_query(text):
+    """
+    Parse a structured query such as "ADAUSDT 3h", "BTCUSDT 1 day" or
+    "ETHUSDT 4h whale threshold 50k". Returns None for free-form text.
+    """
+    match = QUERY_RE.match(text)
+    if not match:
+        return None
+    symbol, value, unit, threshold, suffix = match.groups()
+    seconds = int(value) * UNIT_SECONDS[unit[0].lower()]
+    if seconds <= 0:
+        return None
+    whale_threshold = DEFAULT_WHALE_THRESHOLD
+    if threshold:
+        whale_threshold = float(threshold) * {"k": 1e3, "m": 1e6}.get((suffix or "").lower(), 1)
+    return ParsedQuery(symbol.upper(), seconds, whale_threshold)
+
+
+def parse_window(text):
+    """Parse a window such as "4h" or "1 day" into seconds; None if invalid."""
+    match = WINDOW_RE.match(text)
+    if not match:
+        return None
+    seconds = int(match.group(1)) * UNIT_SECONDS[match.group(2)[0].lower()]
+    return seconds or None
+
 
 def analyzer (symbol, days=0, hours=0, minutes=0, whale_threshold=100000):
     """
@@ -25,19 +90,276 @@ def analyzer (symbol, days=0, hours=0, minutes=0, whale_threshold=100000):
 
     Returns:
         dict: Dictionary containing retail and whale sentiment indices and volumes.
+            "approximate" is True for very long windows, where volumes are
+            estimated from candles and sampled trades. "tiers" lists the
+            sentiment index of trades at or above each USD size tier.
     """
-    buy_vol, sell_vol, whale_buy, whale_sell = get_taker_data(symbol, days, hours, minutes, whale_threshold)    
-    results = analyze_sentiment(buy_vol, sell_vol, whale_buy, whale_sell)
+    seconds = days * 86400 + hours * 3600 + minutes * 60
+    key = (symbol.upper(), seconds, float(whale_threshold))
+    results = analysis_cache.get(key)
+    if results is not None:
+        record("analysis_cache_hits", 1)
+    else:
+        results = window_analyses([symbol], seconds, whale_threshold)[symbol.upper()]
+        if isinstance(results, Exception):
+            raise results
+        analysis_cache.set(key, results, ttl_for_window(seconds))
     return results
-    
 
 
+def window_analyses(symbols, seconds, whale_threshold=DEFAULT_WHALE_THRESHOLD):
+    """
+    analyze_window for several symbols, here or, with ANALYSIS_BACKEND=queue,
+    by the workers (windows covered by live ingestion are still answered
+    here). Returns ``{symbol: analysis dict or exception}``.
+    """
+    symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+    if ANALYSIS_BACKEND != "queue":
+        if len(symbols) == 1:
+            try:
+                return {symbols[0]: analyze_window(symbols[0], seconds, whale_threshold)}
+            except Exception as e:
+                return {symbols[0]: e}
+        days, rest = divmod(seconds, 86400)
+        hours, rest = divmod(rest, 3600)
+        data = get_taker_data_many(symbols, days, hours, rest // 60, whale_threshold)
+        return {symbol: d if isinstance(d, Exception) else window_results(d) for symbol, d in data.items()}
+
+    results, jobs = {}, {}
+    end_ts = int(time.time() * 1000)
+    queue = get_job_queue()
+    for symbol in symbols:
+        data = live_taker_data(symbol, end_ts - seconds * 1000, end_ts, whale_threshold)
+        if data is not None:
+            results[symbol] = window_results(data)
+        else:
+            jobs[queue.submit(symbol, seconds, whale_threshold)] = symbol
+    progress = job_progress.get()
+    on_progress = None
+    if progress is not None:
+        def on_progress(job_id, state):
+            progress(jobs[job_id], state["done"], state["total"], state["volumes"])
+    with stage("queue"):
+        for job_id, result in queue.wait(list(jobs), JOB_TIMEOUT, fetch_abort.get(), on_progress).items():
+            results[jobs[job_id]] = result
+    return {symbol: results[symbol] for symbol in symbols}
+
+
+def analyze_many(symbols, seconds, whale_threshold=DEFAULT_WHALE_THRESHOLD):
+    """
+    analyzer for several symbols over the same window. Cached symbols are
+    served from analysis_cache, the rest are fetched concurrently.
+
+    Returns ``(results, errors)``: ``{symbol: analyzer dict}`` and
+    ``{symbol: error message}``.
+    """
+    results, missing = {}, []
+    for symbol in dict.fromkeys(symbol.upper() for symbol in symbols):
+        cached = analysis_cache.get((symbol, seconds, float(whale_threshold)))
+        if cached is not None:
+            results[symbol] = cached
+        else:
+            missing.append(symbol)
+
+    errors = {}
+    for symbol, analysis in (window_analyses(missing, seconds, whale_threshold) if missing else {}).items():
+        if isinstance(analysis, Exception):
+            errors[symbol] = str(analysis)
+            continue
+        results[symbol] = analysis
+        analysis_cache.set((symbol, seconds, float(whale_threshold)), analysis, ttl_for_window(seconds))
+    return results, errors
+
+
+# How batch rows can be ordered (all descending)
+RANKINGS = {
+    "divergence": lambda row: abs(row["whale_sentiment_index"] - row["sentiment_index"]),
+    "whale": lambda row: row["whale_sentiment_index"],
+    "retail": lambda row: row["sentiment_index"],
+}
+
+
+def rank_results(results, rank="divergence", top=None):
+    """Table rows for analyze_many results, best ``top`` first by ``rank``."""
+    rows = [
+        {
+            "symbol": symbol,
+            "sentiment_index": r["sentiment_index"],
+            "whale_sentiment_index": r["whale_sentiment_index"],
+            "divergence": r["whale_sentiment_index"] - r["sentiment_index"],
+            "buy_volume": r["buy_volume"],
+            "sell_volume": r["sell_volume"],
+            "whale_buy_volume": r["whale_buy_volume"],
+            "whale_sell_volume": r["whale_sell_volume"],
+            "approximate": r.get("approximate", False),
+        }
+        for symbol, r in results.items()
+    ]
+    rows.sort(key=RANKINGS[rank], reverse=True)
+    return rows[:top] if top else rows
+
+
+# -------- FAST PATH -------- #
+# Deterministic report for structured queries, following the same Action
+# Market Theory rules as the agent prompt below, without any LLM call.
+NEUTRAL_BAND = 0.05
+
+# (whale bias, retail bias) -> (comparison, conclusion, insight)
+MARKET_READINGS = {
+    ("bullish", "bearish"): (
+        "Divergence: whales are buying while retail sells — an accumulation phase.",
+        "Bullish",
+        "Large players are absorbing retail selling, which often precedes an upward move.",
+    ),
+    ("bearish", "bullish"): (
+        "Divergence: whales are selling into retail buying — a distribution phase.",
+        "Bearish",
+        "Retail is buying what whales are unloading, a common warning sign before a pullback.",
+    ),
+    ("bullish", "bullish"): (
+        "Alignment: both retail and whales lean bullish.",
+        "Bullish",
+        "Buyers are in control across trade sizes, pointing to trend continuation upward.",
+    ),
+    ("bearish", "bearish"): (
+        "Alignment: both retail and whales lean bearish.",
+        "Bearish",
+        "Sellers dominate across trade sizes, pointing to trend continuation downward.",
+    ),
+    ("balanced", "balanced"): (
+        "Alignment: neither group shows a clear bias.",
+        "Balanced",
+        "The market is indecisive; wait for one side to take control.",
+    ),
+    ("bullish", "balanced"): (
+        "Divergence: whales lean bullish while retail is undecided.",
+        "Bullish",
+        "Quiet whale buying against a flat crowd can be early accumulation.",
+    ),
+    ("bearish", "balanced"): (
+        "Divergence: whales lean bearish while retail is undecided.",
+        "Bearish",
+        "Quiet whale selling against a flat crowd can be early distribution.",
+    ),
+    ("balanced", "bullish"): (
+        "Divergence: retail leans bullish but whales are not following.",
+        "Balanced",
+        "Retail optimism without whale support tends to fade.",
+    ),
+    ("balanced", "bearish"): (
+        "Divergence: retail leans bearish but whales are not following.",
+        "Balanced",
+        "Retail pessimism without whale selling rarely moves price far.",
+    ),
+}
+
+
+def sentiment_bias(index):
+    if index > NEUTRAL_BAND:
+        return "bullish"
+    if index < -NEUTRAL_BAND:
+        return "bearish"
+    return "balanced"
+
+
+def format_window(seconds):
+    for unit, size in (("w", 604800), ("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds % size == 0:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}s"
+
+
+def format_notional(value):
+    for suffix, size in (("M", 1e6), ("k", 1e3)):
+        if value >= size:
+            return f"{value / size:g}{suffix}"
+    return f"{value:g}"
+
 
+def render_report(query, results):
+    """Render the five-section report for analyzer ``results``."""
+    retail_bias = sentiment_bias(results["sentiment_index"])
+    whale_bias = sentiment_bias(results["whale_sentiment_index"])
+    comparison, conclusion, insight = MARKET_READINGS[(whale_bias, retail_bias)]
 
-agent = create_react_agent(
-    model,
-    tools=[analyzer],
-    prompt='''You are a Market Sentiment AI Agent. 
+    whale_volume = results["whale_buy_volume"] + results["whale_sell_volume"]
+    if whale_volume > 0:
+        whale_line = (
+            f"{whale_bias.capitalize()} ({results['whale_sentiment_index']:+.3f}). "
+            f"Whale buys {results['whale_buy_volume']:,.2f} vs sells {results['whale_sell_volume']:,.2f}."
+        )
+    else:
+        whale_line = f"Balanced — no trades above ${query.whale_threshold:,.0f} in this window."
+
+    if results.get("tiers"):
+        whale_line += " By trade size: " + ", ".join(
+            f"≥${format_notional(tier['min_notional'])} {tier['sentiment_index']:+.2f}"
+            for tier in results["tiers"] if tier["buy_volume"] + tier["sell_volume"] > 0
+        ) + "."
+
+    header = f"📊 {query.symbol} · last {format_window(query.seconds)}"
+    if results.get("approximate"):
+        header += " (approximate: candles + sampled trades)"
+
+    return (
+        f"{header}\n\n"
+        f"1. Retail Sentiment → {retail_bias.capitalize()} ({results['sentiment_index']:+.3f}). "
+        f"Taker buys {results['buy_volume']:,.2f} vs sells {results['sell_volume']:,.2f}.\n"
+        f"2. Whale Sentiment → {whale_line}\n"
+        f"3. Comparison → {comparison}\n"
+        f"4. Conclusion → {conclusion}\n"
+        f"5. Insight → {insight}"
+    )
+
+
+def quick_report(query):
+    """Analyze a parsed query and render the report without the LLM."""
+    days, hours, minutes = query.window()
+    results = analyzer(query.symbol, days, hours, minutes, query.whale_threshold)
+    return render_report(query, results)
+
+
+def render_table(rows, seconds):
+    """Plain-text table of batch rows."""
+    lines = [f"📊 {len(rows)} pairs · last {format_window(seconds)}",
+             f"{'Pair':<12} {'Retail':>7} {'Whale':>7} {'Diverg.':>8}  Reading"]
+    for row in rows:
+        retail_bias = sentiment_bias(row["sentiment_index"])
+        whale_bias = sentiment_bias(row["whale_sentiment_index"])
+        conclusion = MARKET_READINGS[(whale_bias, retail_bias)][1]
+        marker = "*" if row["approximate"] else ""
+        lines.append(f"{row['symbol'] + marker:<12} {row['sentiment_index']:+7.3f} "
+                     f"{row['whale_sentiment_index']:+7.3f} {row['divergence']:+8.3f}  {conclusion}")
+    if any(row["approximate"] for row in rows):
+        lines.append("* approximate: candles + sampled trades")
+    return "\n".join(lines)
+
+
+BATCH_SUMMARY_PROMPT = '''You are a Market Sentiment AI Agent. Below is a table of retail and whale
+sentiment indices (range -1 to +1, values between -0.05 and +0.05 are balanced)
+for several trading pairs over the same window. Divergence is the whale index
+minus the retail index.
+
+Apply Action Market Theory: whales buying while retail sells is accumulation,
+whales selling into retail buying is distribution, aligned indices point to
+trend continuation.
+
+In at most six short lines, summarize the market as a whole: the overall bias,
+the pairs with the strongest accumulation or distribution, and anything that
+stands out. Do not restate the whole table.
+
+{table}'''
+
+
+async def summarize_table(table):
+    """One LLM summary over a whole batch table."""
+    # Building the model on first use takes about a second
+    model = await asyncio.to_thread(get_model)
+    response = await model.ainvoke(BATCH_SUMMARY_PROMPT.format(table=table), config=llm_config("summary"))
+    return response.content
+
+
+AGENT_PROMPT = '''You are a Market Sentiment AI Agent. 
 Your role is to analyze market sentiment using the analyzer tool. 
 Always ask the user for a trading pair (e.g., BTCUSDT) and an optional time window (days, hours, minutes). 
 Then call the analyzer tool with those inputs.
@@ -62,18 +384,89 @@ Apply Action Market Theory:
 - If both indices are near zero → market is balanced / indecisive
 - If indices diverge → highlight divergence and explain implications
 
+3. Size tiers ("tiers"): the sentiment index of the trades at or above each USD size
+   - Compare small and large tiers to show how sentiment changes with trade size
+
+If the results are marked "approximate", mention that the figures are estimates.
+
 Format your response as:
 
 1. Retail Sentiment → clear summary  
 2. Whale Sentiment → clear summary  
 3. Comparison → alignment or divergence  
 4. Conclusion → Bullish / Bearish / Balanced  
-5. Optional insight → one sentence, simple and human-readable''',
+5. Optional insight → one sentence, simple and human-readable'''
+
+
+_metrics_handler = None
+
+
+def llm_config(kind):
+    """Run config whose callback records the latency and token usage of each LLM call as ``kind``."""
+    global _metrics_handler
+    if _metrics_handler is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class LLMMetrics(BaseCallbackHandler):
+            run_inline = True  # in the caller's context, so record() reaches its request
+
+            def __init__(self, kind):
+                self.kind = kind
+                self.started = {}
+
+            def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+                self.started[run_id] = time.perf_counter()
+
+            def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+                self.started[run_id] = time.perf_counter()
+
+            def on_llm_end(self, response, *, run_id, **kwargs):
+                self._finish(run_id, "ok")
+                usage = [getattr(g, "message", None) for gens in response.generations for g in gens]
+                usage = [m.usage_metadata for m in usage if getattr(m, "usage_metadata", None)]
+                for direction in ("input", "output"):
+                    tokens = sum(u.get(f"{direction}_tokens", 0) for u in usage)
+                    LLM_TOKENS.inc(tokens, kind=self.kind, direction=direction)
+                    record(f"llm_{direction}_tokens", tokens)
+
+            def on_llm_error(self, error, *, run_id, **kwargs):
+                self._finish(run_id, "error")
+
+            def _finish(self, run_id, outcome):
+                started = self.started.pop(run_id, None)
+                if started is not None:
+                    elapsed = time.perf_counter() - started
+                    LLM_SECONDS.observe(elapsed, kind=self.kind, outcome=outcome)
+                    record("llm_seconds", elapsed)
+                    record("llm_calls", 1)
+
+        _metrics_handler = LLMMetrics
+    return {"callbacks": [_metrics_handler(kind)]}
+
+
+def get_model():
+    global _model
+    with _agent_lock:
+        if _model is None:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            _model = ChatGoogleGenerativeAI(model="gemini-2.5-flash", google_api_key=os.getenv("GOOGLE_API_KEY"))
+        return _model
+
+
+def get_agent():
+    global _agent
+    model = get_model()
+    with _agent_lock:
+        if _agent is None:
+            from langgraph.prebuilt import create_react_agent
+
+            _agent = create_react_agent(model, tools=[analyzer], prompt=AGENT_PROMPT)
+        return _agent
 
-)
 
 if __name__ == "__main__":
-    response = agent.invoke(
+    response = get_agent().invoke(
         {"messages": [{"role": "user", "content": "ADAUSDT 3 hours"}]}
     )
 
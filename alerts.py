@@ -0,0 +1,103 @@
+"""
+Sentiment alert rules, evaluated on the numeric indices only (no LLM).
+
+A rule such as "whale > 0.3" or "divergence below -0.4" belongs to a saved
+signal (symbol, timeframe, whale threshold). It fires when its condition
+becomes true, then stays quiet until the value has moved back past the
+threshold by ALERT_HYSTERESIS, and never fires twice within ALERT_COOLDOWN.
+"""
+import os
+import re
+
+# Seconds between rule checks, and the minimum gap between two firings of one rule
+ALERT_CHECK_INTERVAL = int(os.getenv("ALERT_CHECK_INTERVAL", "60"))
+ALERT_COOLDOWN = float(os.getenv("ALERT_COOLDOWN", "900"))
+# How far back past the threshold the value must go before the rule re-arms
+ALERT_HYSTERESIS = float(os.getenv("ALERT_HYSTERESIS", "0.05"))
+MAX_ALERTS_PER_USER = 10
+
+# Rule metric -> field of an /analyze/batch row
+METRICS = {
+    "whale": "whale_sentiment_index",
+    "retail": "sentiment_index",
+    "divergence": "divergence",  # whale index minus retail index
+}
+METRIC_LABELS = {"whale": "whale index", "retail": "retail index", "divergence": "whale/retail divergence"}
+
+RULE_RE = re.compile(
+    r"^\s*(whale|retail|divergence)\s*(?:index\s*)?(>|<|(?:crosses\s+)?(?:above|below))\s*([+-]?\d*\.?\d+)"
+    r"(\s+narrative)?\s*$",
+    re.IGNORECASE,
+)
+
+
+def parse_rule(text):
+    """
+    Parse a rule such as "whale > 0.3", "retail below -0.2" or "divergence
+    crosses above 0.5 narrative" (narrative: add an LLM analysis when it
+    fires). Returns None if the text isn't a valid rule.
+    """
+    match = RULE_RE.match(text)
+    if not match:
+        return None
+    metric, op, threshold, narrative = match.groups()
+    threshold = float(threshold)
+    limit = 2.0 if metric.lower() == "divergence" else 1.0
+    if not -limit < threshold < limit:
+        return None
+    return {
+        "metric": metric.lower(),
+        "op": ">" if op == ">" or op.lower().endswith("above") else "<",
+        "threshold": threshold,
+        "narrative": bool(narrative),
+    }
+
+
+def _condition(rule, row):
+    """Whether ``row`` meets the rule, and whether it is back past the threshold by the hysteresis."""
+    value = row[METRICS[rule["metric"]]]
+    threshold = rule["threshold"]
+    if rule["op"] == ">":
+        return value > threshold, value <= threshold - ALERT_HYSTERESIS
+    return value < threshold, value >= threshold + ALERT_HYSTERESIS
+
+
+def initial_armed(rule, row):
+    """
+    Armed state for a new rule, given the current ``row`` (None if unknown).
+    A condition that already holds, or can't be checked yet, has to clear
+    first, so a new rule only fires on a later crossing.
+    """
+    return row is not None and not _condition(rule, row)[0]
+
+
+def evaluate(rule, row, now):
+    """
+    Check ``rule`` against an /analyze/batch ``row`` at unix time ``now``.
+    Returns True if it fires; updates the rule's ``armed`` and ``last_fired``.
+    """
+    met, cleared = _condition(rule, row)
+    if not rule["armed"]:
+        if cleared:
+            rule["armed"] = True
+        return False
+    if met and now - (rule["last_fired"] or 0) >= ALERT_COOLDOWN:
+        rule["armed"] = False
+        rule["last_fired"] = now
+        return True
+    return False
+
+
+def describe_rule(rule):
+    direction = "above" if rule["op"] == ">" else "below"
+    text = f"{METRIC_LABELS[rule['metric']]} {direction} {rule['threshold']:+.2f}"
+    return text + " (+ narrative)" if rule["narrative"] else text
+
+
+def format_alert(rule, row):
+    """The message sent when ``rule`` fires on ``row``."""
+    return (
+        f"🚨 {rule['symbol']} {rule['timeframe']}: {describe_rule(rule)}\n"
+        f"🐋 Whale {row['whale_sentiment_index']:+.3f} · 👥 Retail {row['sentiment_index']:+.3f} · "
+        f"↔️ Divergence {row['divergence']:+.3f}"
+    )
@@ -1,19 +1,361 @@
 # api.py
-from fastapi import FastAPI
-from pydantic import BaseModel
-from agent import agent  # import your agent
+import asyncio
+import contextvars
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Literal, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from agent import ANALYSIS_BACKEND, get_agent, analysis_cache, parse_query, quick_report, DEFAULT_WHALE_THRESHOLD  # import your agent
+from agent import analyze_many, llm_config, parse_window, rank_results, render_table, summarize_table
+from tool import AbortSignal, FetchError, fetch_abort, fetch_progress, analyze_sentiment, running_volumes
+from cache import TTLCache, ttl_for_window
+from history import sentiment_history
+from jobs import JobError, get_job_queue, job_progress
+from metrics import Counter, Gauge, Histogram, Timings, record, render, request_timings
+import tool
 
-app = FastAPI(title="Market Sentiment Agent API")
+# Keep recent trades of the saved signals' symbols in memory from the aggTrade stream
+LIVE_INGEST = os.getenv("LIVE_INGEST", "1") == "1"
+
+live_ingestor = None
+ready = False  # set once startup has finished; see /ready
+
+@asynccontextmanager
+async def lifespan(app):
+    global live_ingestor, ready
+    task = None
+    if LIVE_INGEST:
+        from ingest import Ingestor
+        live_ingestor = tool.live_source = Ingestor()
+        task = asyncio.ensure_future(live_ingestor.run())
+    ready = True
+    try:
+        yield
+    finally:
+        ready = False
+        if task is not None:
+            task.cancel()
+            tool.live_source = None
+        tool.close_client()
+
+app = FastAPI(title="Market Sentiment Agent API", lifespan=lifespan)
+
+# Blocking analysis (Binance fetch + aggregation) runs in a bounded pool so the
+# event loop stays free; LLM agent runs are capped separately. With the job
+# queue these threads only wait for workers, so more of them are cheap
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "32" if ANALYSIS_BACKEND == "queue" else "4"))
+AGENT_CONCURRENCY = int(os.getenv("AGENT_CONCURRENCY", "4"))
+ANALYZE_TIMEOUT = float(os.getenv("ANALYZE_TIMEOUT", "300"))
+STREAM_HEARTBEAT = 10  # seconds between heartbeat events on a quiet stream
+BATCH_MAX_SYMBOLS = int(os.getenv("BATCH_MAX_SYMBOLS", "50"))
+HISTORY_MAX_DAYS = float(os.getenv("HISTORY_MAX_DAYS", "7"))
+HISTORY_MAX_AGE_DAYS = float(os.getenv("HISTORY_MAX_AGE_DAYS", "30"))
+
+_analysis_pool = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="analysis")
+_agent_slots = asyncio.Semaphore(AGENT_CONCURRENCY)
+
+# Identical queries in flight share one agent run (single-flight)
+_inflight = {}
+
+# Final agent text for structured queries, keyed on the parsed query
+response_cache = TTLCache(maxsize=256)
+
+HTTP_SECONDS = Histogram("http_request_seconds", "Time to respond to HTTP requests", ["route", "status"])
+ANALYZE_SECONDS = Histogram("analyze_seconds", "End-to-end time to answer an analysis query", ["path"])
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Result cache lookups", ["cache", "result"], callback=lambda: {
+    (name, result): cache.stats()[result]
+    for name, cache in (("analysis", analysis_cache), ("response", response_cache))
+    for result in ("hits", "misses")
+})
+JOBS = Gauge("analysis_jobs", "Jobs in the analysis queue by status (ANALYSIS_BACKEND=queue)", ["status"],
+             callback=lambda: {(status,): count for status, count in get_job_queue().stats()["counts"].items()}
+             if ANALYSIS_BACKEND == "queue" else {})
+INFLIGHT = Gauge("analyses_in_flight", "Distinct analyses running (single-flight keys)",
+                 callback=lambda: {(): len(_inflight)})
 
 class SentimentRequest(BaseModel):
     query: str  # e.g., "BTCUSDT 1 day"
+    # "auto": structured queries get the templated report, free text goes to the LLM
+    # "narrative": always ask the LLM
+    mode: Literal["auto", "narrative"] = "auto"
+    timings: bool = False  # include a per-stage timing breakdown in the response
 
 class SentimentResponse(BaseModel):
     result: str
+    timings: Optional[dict] = None
+
+class BatchRequest(BaseModel):
+    symbols: list[str]  # e.g., ["BTCUSDT", "ETHUSDT"]
+    window: str = "1h"
+    whale_threshold: float = DEFAULT_WHALE_THRESHOLD
+    rank: Literal["divergence", "whale", "retail"] = "divergence"
+    top: Optional[int] = Field(None, ge=1)  # keep only the first N pairs after ranking
+    summary: bool = False  # one LLM summary over the whole table
+    timings: bool = False  # include a per-stage timing breakdown in the response
+
+async def cancellable(coro):
+    """Await ``coro``; if it is cancelled, abort the Binance fetches it started."""
+    abort = AbortSignal()
+    fetch_abort.set(abort)
+    try:
+        return await coro
+    except asyncio.CancelledError:
+        abort.set()
+        raise
+
+async def run_blocking(fn, *args):
+    """Run ``fn(*args)`` in the analysis pool, carrying over the caller's context."""
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_analysis_pool, ctx.run, fn, *args)
+
+async def run_report(parsed):
+    return await run_blocking(quick_report, parsed)
+
+async def run_agent(query: str) -> str:
+    # get_agent() imports and builds the agent on first use: not on the event loop
+    agent = await asyncio.to_thread(get_agent)
+    async with _agent_slots:
+        response = await agent.ainvoke({"messages": [{"role": "user", "content": query}]}, config=llm_config("agent"))
+    return response["messages"][-1].content
+
+async def single_flight(key, fn, *args):
+    """
+    Run ``fn(*args)`` once per ``key`` at a time, with the request timeout;
+    concurrent callers share the result.
+    """
+    task = _inflight.get(key)
+    if task is not None:
+        # The breakdown of shared work goes to the request that started it
+        record("joined_in_flight", 1)
+    else:
+        task = asyncio.ensure_future(asyncio.wait_for(cancellable(fn(*args)), ANALYZE_TIMEOUT))
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _inflight.pop(key) if _inflight.get(key) is t else None)
+    # Shielded so one caller disconnecting doesn't cancel the others' result
+    return await asyncio.shield(task)
+
+def timeout_message():
+    return f"⏱ Analysis timed out after {ANALYZE_TIMEOUT:g}s, please try again."
+
+def timeout_response():
+    return JSONResponse(status_code=504, content={"result": timeout_message()})
+
+def start_timings(enabled):
+    """Collect a timing breakdown for the current request, if it asked for one."""
+    if not enabled:
+        return None
+    timings = Timings()
+    request_timings.set(timings)
+    return timings
+
+async def answer(req: SentimentRequest) -> str:
+    """Produce the analysis text for a request (raises asyncio.TimeoutError)."""
+    start = time.perf_counter()
+    path = "error"
+    try:
+        parsed = parse_query(req.query)
+        if parsed is not None and req.mode == "auto":
+            # Fast path: no LLM round trips, just the fetch
+            try:
+                result = await single_flight(("report", parsed), run_report, parsed)
+                path = "report"
+            except (FetchError, JobError) as e:
+                result = f"⚠️ Couldn't analyze {parsed.symbol}: {e}"
+                path = "fetch_error"
+            except asyncio.TimeoutError:
+                raise
+            except Exception as e:
+                # A bug in the analysis still gets a readable reply
+                print(f"Analysis of {parsed.symbol} failed: {e!r}")
+                result = f"⚠️ Couldn't analyze {parsed.symbol}: {e}"
+            return result
+
+        if parsed is not None:
+            cached = response_cache.get(parsed)
+            if cached is not None:
+                path = "cached"
+                return cached
+
+        # Run agent
+        key = parsed or " ".join(req.query.upper().split())
+        final_message = await single_flight(key, run_agent, req.query)
+        path = "agent"
+        if parsed is not None:
+            response_cache.set(parsed, final_message, ttl_for_window(parsed.seconds))
+        return final_message
+    except asyncio.TimeoutError:
+        path = "timeout"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        ANALYZE_SECONDS.observe(elapsed, path=path)
+        record("total_seconds", elapsed)
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    HTTP_SECONDS.observe(time.perf_counter() - start, route=route.path if route else "other",
+                         status=response.status_code)
+    return response
 
 @app.post("/analyze", response_model=SentimentResponse)
 async def analyze_market(req: SentimentRequest):
-    # Run agent
-    response = agent.invoke({"messages": [{"role": "user", "content": req.query}]})
-    final_message = response["messages"][-1].content
-    return {"result": final_message}
+    timings = start_timings(req.timings)
+    try:
+        result = await answer(req)
+    except asyncio.TimeoutError:
+        return timeout_response()
+    return {"result": result, "timings": timings.as_dict() if timings else None}
+
+@app.post("/analyze/batch")
+async def analyze_batch(req: BatchRequest):
+    """Retail/whale indices for many symbols over one window, ranked."""
+    seconds = parse_window(req.window)
+    if seconds is None:
+        return JSONResponse(status_code=400, content={"error": f"Invalid window: {req.window}"})
+    symbols = tuple(dict.fromkeys(symbol.strip().upper() for symbol in req.symbols if symbol.strip()))
+    if not symbols or len(symbols) > BATCH_MAX_SYMBOLS:
+        return JSONResponse(status_code=400, content={"error": f"Send between 1 and {BATCH_MAX_SYMBOLS} symbols."})
+
+    timings = start_timings(req.timings)
+    start = time.perf_counter()
+    try:
+        key = ("batch", symbols, seconds, float(req.whale_threshold))
+        results, errors = await single_flight(key, run_blocking, analyze_many, symbols, seconds, req.whale_threshold)
+    except asyncio.TimeoutError:
+        return timeout_response()
+    rows = rank_results(results, req.rank, req.top)
+
+    summary = None
+    if req.summary and rows:
+        async with _agent_slots:
+            summary = await summarize_table(render_table(rows, seconds))
+    response = {"window": req.window, "rows": rows, "errors": errors, "summary": summary}
+    if timings:
+        timings.add("total_seconds", time.perf_counter() - start)
+        response["timings"] = timings.as_dict()
+    return response
+
+@app.post("/analyze/stream")
+async def analyze_market_stream(req: SentimentRequest):
+    """
+    Stream an analysis as NDJSON events:
+    "progress" (sub-windows fetched), "partial" (running indices over the
+    trades fetched so far, sent only while the whole window is being fetched;
+    an update of stored or rolling state covers just its new tail),
+    "heartbeat", then "result" or "error".
+    """
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    parsed = parse_query(req.query)
+    whale_threshold = parsed.whale_threshold if parsed else DEFAULT_WHALE_THRESHOLD
+    volumes = {}  # symbol -> running [buy, sell, whale buy, whale sell, trades]
+
+    def on_progress(symbol, trades, done, total, whole_window):
+        # Called from the analysis thread as each sub-window arrives
+        running = None
+        if whole_window:
+            running = volumes[symbol] = running_volumes(volumes.get(symbol), trades, whale_threshold)
+        on_job_progress(symbol, done, total, running)
+
+    def on_job_progress(symbol, done, total, running):
+        # Also called directly for analyses queued to the workers
+        loop.call_soon_threadsafe(events.put_nowait, {"event": "progress", "symbol": symbol, "done": done, "total": total})
+        if running is None:
+            return
+        partial = analyze_sentiment(*running[:4])
+        loop.call_soon_threadsafe(events.put_nowait, {
+            "event": "partial",
+            "symbol": symbol,
+            "trades": running[4],
+            "sentiment_index": partial["sentiment_index"],
+            "whale_sentiment_index": partial["whale_sentiment_index"],
+        })
+
+    async def produce():
+        fetch_progress.set(on_progress)
+        job_progress.set(on_job_progress)
+        try:
+            events.put_nowait({"event": "result", "result": await answer(req)})
+        except asyncio.TimeoutError:
+            events.put_nowait({"event": "error", "result": timeout_message()})
+        except Exception as e:
+            events.put_nowait({"event": "error", "result": f"❌ Error: {e}"})
+        events.put_nowait(None)
+
+    async def stream():
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    event = {"event": "heartbeat"}
+                if event is None:
+                    break
+                yield json.dumps(event) + "\n"
+        finally:
+            producer.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.get("/sentiment/history")
+async def history(symbol: str, resolution: Literal["1m", "5m", "1h"] = "5m", window: str = "1d",
+                  end: Optional[int] = None, whale_threshold: float = DEFAULT_WHALE_THRESHOLD):
+    """
+    Retail/whale sentiment series for ``symbol`` over ``window`` ending at
+    ``end`` (ms, default now), one point per ``resolution``.
+    """
+    seconds = parse_window(window)
+    if seconds is None or seconds > HISTORY_MAX_DAYS * 86400:
+        return JSONResponse(status_code=400, content={"error": f"window must be between 1m and {HISTORY_MAX_DAYS:g}d"})
+    now = int(time.time() * 1000)
+    end_ts = min(end or now, now)
+    if end_ts < now - HISTORY_MAX_AGE_DAYS * 86400 * 1000:
+        return JSONResponse(status_code=400, content={"error": f"end must be within the last {HISTORY_MAX_AGE_DAYS:g}d"})
+    start_ts = end_ts - seconds * 1000
+    symbol = symbol.strip().upper()
+
+    try:
+        key = ("history", symbol, resolution, start_ts // 60000, end_ts // 60000, whale_threshold)
+        points = await single_flight(key, run_blocking, sentiment_history, symbol, start_ts, end_ts,
+                                     resolution, whale_threshold)
+    except asyncio.TimeoutError:
+        return timeout_response()
+    except FetchError as e:
+        return JSONResponse(status_code=400, content={"error": f"Couldn't load {symbol}: {e}"})
+    return {"symbol": symbol, "resolution": resolution, "points": points}
+
+@app.get("/ready")
+async def readiness():
+    """200 once the API accepts work (the model and Binance client are built on first use)."""
+    if not ready:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics."""
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {"analysis": analysis_cache.stats(), "response": response_cache.stats()}
+
+@app.get("/jobs/stats")
+async def job_stats():
+    """Analysis job queue depth (ANALYSIS_BACKEND=queue)."""
+    if ANALYSIS_BACKEND != "queue":
+        return {"backend": ANALYSIS_BACKEND}
+    return {"backend": ANALYSIS_BACKEND, **await run_blocking(get_job_queue().stats)}
+
+@app.get("/live/stats")
+async def live_stats():
+    return live_ingestor.stats() if live_ingestor else {"connected": False, "symbols": {}}
@@ -0,0 +1,654 @@
+"""
+Benchmarks for the sentiment pipeline hot paths.
+
+Usage:
+    python bench.py aggregation [--trades 1000000]
+    python bench.py fetch [--trades 200000] [--latency 0.02] [--tape FILE]
+    python bench.py pipeline [--trades 1000000] [--tape FILE]
+    python bench.py load [--concurrency 16] [--requests 64] [--mode narrative]
+    python bench.py fanout [--users 200] [--groups 20]
+    python bench.py live [--trades 200000] [--drop 50]
+    python bench.py http [--requests 2000] [--concurrency 16]
+    python bench.py startup [--runs 5]
+    python bench.py record BTCUSDT [--hours 6] [--out btcusdt.npz]
+
+Suites that go through the trade store use a throwaway TRADE_STORE_DIR.
+Binance is always the local fake, serving synthetic tapes or ones captured
+with ``record``; the LLM is a stub that calls the analyzer and answers after
+``--llm-latency`` seconds.
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime as dt
+import io
+import os
+import socket
+import tempfile
+import threading
+import time
+import numpy as np
+
+os.environ.setdefault("TRADE_STORE_DIR", tempfile.mkdtemp(prefix="bench-trades-"))
+os.environ.setdefault("GOOGLE_API_KEY", "bench")
+os.environ.setdefault("LIVE_INGEST", "0")
+
+import tool
+from fake_binance import FakeBinance, ReplayStream, load_tape, save_tape, synthetic_tape
+
+
+def synthetic_pages(total, page_size=tool.PAGE_LIMIT, seed=0):
+    """Build aggTrade pages shaped like Binance's JSON (string price/qty)."""
+    rng = np.random.default_rng(seed)
+    start_ts = 1_700_000_000_000
+    prices = rng.uniform(10, 20, total)
+    qtys = rng.exponential(500, total)
+    makers = rng.random(total) < 0.5
+    pages = []
+    for offset in range(0, total, page_size):
+        pages.append([
+            {"a": i, "p": f"{prices[i]:.8f}", "q": f"{qtys[i]:.8f}", "f": i, "l": i,
+             "T": start_ts + i * 50, "m": bool(makers[i]), "M": True}
+            for i in range(offset, min(offset + page_size, total))
+        ])
+    return pages
+
+
+def legacy_aggregate(pages, whale_threshold):
+    """The original per-trade loop from fetch_trades, kept for comparison."""
+    taker_buy_volume = taker_sell_volume = whale_buy_volume = whale_sell_volume = 0
+    all_trades = []
+    for trades in pages:
+        for trade in trades:
+            qty = float(trade['q'])
+            price = float(trade['p'])
+            timestamp = dt.datetime.fromtimestamp(trade['T'] / 1000, dt.timezone.utc)
+            trade_value = qty * price
+            if trade['m']:
+                taker_sell_volume += qty
+                side = "SELL"
+                if trade_value >= whale_threshold:
+                    whale_sell_volume += qty
+            else:
+                taker_buy_volume += qty
+                side = "BUY"
+                if trade_value >= whale_threshold:
+                    whale_buy_volume += qty
+            all_trades.append([timestamp, price, qty, side])
+    return taker_buy_volume, taker_sell_volume, whale_buy_volume, whale_sell_volume
+
+
+def vectorized_aggregate(pages, whale_threshold):
+    """Page → columns → masked sums, as fetch_trades does now."""
+    trades = tool.concat_columns([tool.page_to_columns(page) for page in pages])
+    return tool.aggregate_trades(trades, whale_threshold)
+
+
+def timed(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def sample_latency(fn, *args, repeat=20):
+    """Run ``fn(*args)`` ``repeat`` times; returns the durations and the last result."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        samples.append(time.perf_counter() - start)
+    return samples, result
+
+
+def bench_tape(args, end_ts):
+    """The captured ``--tape``, or ``--trades`` synthetic trades over ``--hours``, ending at ``end_ts``."""
+    if getattr(args, "tape", None):
+        return load_tape(args.tape, end_ts)
+    span_ms = int(args.hours * 3_600_000)
+    tape = synthetic_tape(args.trades, start_ts=end_ts - span_ms, trades_per_sec=args.trades / (span_ms / 1000))
+    tape["T"] -= tape["T"][-1] - end_ts
+    return tape
+
+
+def stub_chat_model(latency):
+    """Chat model standing in for Gemini: calls the analyzer for the query, then answers."""
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.messages import AIMessage, ToolMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+    import agent
+
+    class StubChatModel(BaseChatModel):
+        latency: float = 0.0
+
+        @property
+        def _llm_type(self):
+            return "stub"
+
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+        def _reply(self, messages):
+            last = messages[-1]
+            if isinstance(last, ToolMessage):
+                message = AIMessage(content=f"1. Retail Sentiment → {last.content[:200]}")
+            else:
+                parsed = agent.parse_query(str(last.content))
+                days, hours, minutes = parsed.window()
+                message = AIMessage(content="", tool_calls=[{
+                    "name": "analyzer", "id": f"call-{time.monotonic_ns()}",
+                    "args": {"symbol": parsed.symbol, "days": days, "hours": hours, "minutes": minutes,
+                             "whale_threshold": parsed.whale_threshold},
+                }])
+            prompt_chars = sum(len(str(m.content)) for m in messages)
+            message.usage_metadata = {"input_tokens": prompt_chars // 4, "output_tokens": len(str(message.content)) // 4,
+                                      "total_tokens": (prompt_chars + len(str(message.content))) // 4}
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            time.sleep(self.latency)
+            return self._reply(messages)
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            await asyncio.sleep(self.latency)
+            return self._reply(messages)
+
+    return StubChatModel(latency=latency)
+
+
+def throughput(samples, count=1, unit="calls"):
+    """Latency percentiles of ``samples`` and the rate of ``count`` items per sample."""
+    return f"{percentiles(samples)}  {count * len(samples) / sum(samples):>12,.0f} {unit}/sec"
+
+
+def bench_aggregation(args):
+    pages = synthetic_pages(args.trades)
+    print(f"Aggregating {args.trades} trades in {len(pages)} pages (best of 3)")
+
+    legacy_time, legacy = timed(legacy_aggregate, pages, args.whale_threshold)
+    vector_time, vector = timed(vectorized_aggregate, pages, args.whale_threshold)
+    assert np.allclose(legacy, vector), (legacy, vector)
+
+    print(f"  legacy loop : {args.trades / legacy_time:>14,.0f} trades/sec")
+    print(f"  vectorized  : {args.trades / vector_time:>14,.0f} trades/sec")
+    print(f"  speedup     : {legacy_time / vector_time:.1f}x")
+
+
+def bench_fetch(args):
+    tape = load_tape(args.tape) if args.tape else synthetic_tape(args.trades)
+    args.trades = len(tape["a"])
+    server = FakeBinance({"BTCUSDT": tape}, latency=args.latency, error_rate=args.error_rate).start()
+    tool.get_client().API_URL = server.api_url
+    start_ts, end_ts = int(tape["T"][0]), int(tape["T"][-1])
+    hours = (end_ts - start_ts) / 3_600_000
+    print(f"Fetching {args.trades} trades ({hours:.1f}h) from a fake server with {args.latency * 1000:.0f}ms latency")
+
+    try:
+        for name, fetch in (("sequential", tool.fetch_range), ("parallel", tool.fetch_range_parallel)):
+            requests_before = server.requests
+            start = time.perf_counter()
+            trades = fetch("BTCUSDT", start_ts, end_ts)
+            elapsed = time.perf_counter() - start
+            assert np.array_equal(trades["a"], tape["a"]), f"{name} fetch lost or reordered trades"
+            print(f"  {name:<10}: {elapsed:6.2f}s  {args.trades / elapsed:>12,.0f} trades/sec  "
+                  f"{server.requests - requests_before} requests")
+
+        start = time.perf_counter()
+        try:
+            tool.fetch_range_parallel("NOSUCHPAIR", start_ts, end_ts)
+        except tool.FetchError as e:
+            print(f"  bad symbol: failed in {time.perf_counter() - start:.2f}s ({e})")
+    finally:
+        server.stop()
+
+
+def bench_pipeline(args):
+    now_ms = int(time.time() * 1000)
+    tape = bench_tape(args, now_ms)
+    count = len(tape["a"])
+    binance = FakeBinance({"BTCUSDT": tape}, latency=args.latency).start()
+    tool.get_client().API_URL = binance.api_url
+    start_time = dt.datetime.fromtimestamp(int(tape["T"][0]) / 1000, dt.timezone.utc)
+    end_time = dt.datetime.fromtimestamp(now_ms / 1000, dt.timezone.utc)
+    window = end_time - start_time
+    print(f"Pipeline over {count:,} trades ({window.total_seconds() / 3600:.1f}h), "
+          f"{args.latency * 1000:.0f}ms fake Binance latency, {args.repeat} runs each")
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            data = tool.fetch_trades("BTCUSDT", start_time, end_time, args.whale_threshold)
+            cold = time.perf_counter() - start
+            requests = binance.requests
+            stored, data = sample_latency(tool.fetch_trades, "BTCUSDT", start_time, end_time, args.whale_threshold,
+                                          repeat=args.repeat)
+        assert np.isclose(sum(data[:2]), tape["q"].sum()), "fetch_trades lost trades"
+
+        rolling = tool.rolling_sentiment("BTCUSDT", window, args.whale_threshold)
+        with contextlib.redirect_stdout(io.StringIO()):
+            first, _ = sample_latency(rolling.refresh, repeat=1)
+            refresh, _ = sample_latency(rolling.refresh, repeat=args.repeat)
+        analyze, _ = sample_latency(lambda: tool.analyze_sentiment(*data, histogram=data.histogram), repeat=args.repeat)
+
+        print(f"  fetch_trades, cold store    : {cold:8.2f}s  {count / cold:>12,.0f} trades/sec  {requests} requests")
+        print(f"  fetch_trades, stored window : {throughput(stored, count, 'trades')}")
+        print(f"  rolling refresh, first      : {first[0] * 1000:8.1f}ms")
+        print(f"  rolling refresh, next       : {throughput(refresh, 1, 'refreshes')}")
+        print(f"  analyze_sentiment           : {throughput(analyze)}")
+    finally:
+        binance.stop()
+
+
+def percentiles(samples):
+    samples = np.asarray(samples) * 1000
+    return f"p50 {np.percentile(samples, 50):8.1f}ms  p99 {np.percentile(samples, 99):8.1f}ms"
+
+
+def serve_api(port):
+    """Run api.app under uvicorn in a background thread."""
+    import uvicorn
+    import api
+
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def bench_load(args):
+    import httpx
+    import agent
+
+    # One hour of tape per symbol, ending now, so "<SYMBOL> 1h" covers all of it
+    now_ms = int(time.time() * 1000)
+    count = args.trades_per_symbol
+    symbols = [f"SYM{i:02d}USDT" for i in range(args.symbols)]
+    tapes = {s: synthetic_tape(count, start_ts=now_ms - 3_600_000, trades_per_sec=count / 3600, seed=i)
+             for i, s in enumerate(symbols)}
+    binance = FakeBinance(tapes, latency=args.latency).start()
+    tool.get_client().API_URL = binance.api_url
+    if args.mode == "narrative":
+        agent._model = stub_chat_model(args.llm_latency)
+    server, thread = serve_api(free_port())
+    base_url = f"http://127.0.0.1:{server.config.port}"
+    import api
+
+    async def run():
+        latencies, pings = [], []
+        limit = asyncio.Semaphore(args.concurrency)
+        done = asyncio.Event()
+
+        async with httpx.AsyncClient(base_url=base_url, timeout=600) as client:
+            async def analyze(i):
+                async with limit:
+                    # Drop cached results so every request really fetches and aggregates
+                    agent.analysis_cache.clear()
+                    api.response_cache.clear()
+                    start = time.perf_counter()
+                    response = await client.post("/analyze", json={"query": f"{symbols[i % len(symbols)]} 1h",
+                                                                   "mode": args.mode})
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+
+            async def ping():
+                # A cheap endpoint: stays fast only if the event loop isn't blocked
+                while not done.is_set():
+                    start = time.perf_counter()
+                    await client.get("/cache/stats")
+                    pings.append(time.perf_counter() - start)
+                    await asyncio.sleep(0.05)
+
+            pinger = asyncio.create_task(ping())
+            start = time.perf_counter()
+            await asyncio.gather(*(analyze(i) for i in range(args.requests)))
+            elapsed = time.perf_counter() - start
+            done.set()
+            await pinger
+        return latencies, pings, elapsed
+
+    print(f"{args.requests} {args.mode} /analyze requests, {args.concurrency} concurrent, over {len(symbols)} symbols "
+          f"of {count} trades ({args.latency * 1000:.0f}ms fake Binance latency)")
+    if args.mode == "narrative":
+        print(f"  stub LLM answering after {args.llm_latency * 1000:.0f}ms per call")
+    try:
+        latencies, pings, elapsed = asyncio.run(run())
+    finally:
+        server.should_exit = True
+        thread.join()
+        binance.stop()
+    print(f"  /analyze     : {percentiles(latencies)}  {len(latencies) / elapsed:6.1f} req/s")
+    print(f"  /cache/stats : {percentiles(pings)}  (event loop responsiveness)")
+
+
+def bench_fanout(args):
+    import types
+    import httpx
+    import agent
+    import bot
+    from userdb import UserStore
+
+    # Loop tick with every subscriber due at once: one /analyze per group,
+    # fanned out to its subscribers through a stand-in for the Telegram Bot API
+    now_ms = int(time.time() * 1000)
+    symbols = [f"SYM{i:02d}USDT" for i in range(args.groups)]
+    tapes = {s: synthetic_tape(args.trades_per_symbol, start_ts=now_ms - 3_600_000,
+                               trades_per_sec=args.trades_per_symbol / 3600, seed=i) for i, s in enumerate(symbols)}
+    binance = FakeBinance(tapes, latency=args.latency).start()
+    tool.get_client().API_URL = binance.api_url
+    server, thread = serve_api(free_port())
+    bot.API_URL = f"http://127.0.0.1:{server.config.port}/analyze"
+    bot.user_store = UserStore(os.path.join(tempfile.mkdtemp(prefix="bench-users-"), "users.db"), legacy_json=None)
+
+    for uid in range(args.users):
+        signal = {"symbol": symbols[uid % args.groups], "timeframe": "1h"}
+        bot.subscribe_loop(None, str(uid), signal, 60, "1m", next_run=dt.datetime.now(), schedule=False)
+
+    class FakeJobQueue:
+        def run_once(self, callback, when, data=None):
+            return types.SimpleNamespace(schedule_removal=lambda: None)
+
+    class FakeTelegram:
+        def __init__(self):
+            self.latencies = []
+
+        async def send_message(self, chat_id, text):
+            await asyncio.sleep(args.send_latency)
+            self.latencies.append(time.perf_counter() - tick_start)
+
+    async def run():
+        nonlocal tick_start
+        bot.api_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=bot.API_CONNECTIONS), timeout=600)
+        ticks = []
+        try:
+            for _ in range(args.ticks):
+                agent.analysis_cache.clear()
+                for info in bot.user_loop_info.values():
+                    info["next_run"] = dt.datetime.now()
+                tick_start = time.perf_counter()
+                await asyncio.gather(*(
+                    bot.loop_task(types.SimpleNamespace(job=types.SimpleNamespace(data=key), bot=telegram,
+                                                        job_queue=jobs))
+                    for key in list(bot.loop_groups)
+                ))
+                ticks.append(time.perf_counter() - tick_start)
+        finally:
+            await bot.api_client.aclose()
+        return ticks
+
+    telegram = FakeTelegram()
+    jobs = FakeJobQueue()
+    tick_start = 0.0
+    print(f"{args.users} loop subscribers in {args.groups} groups, {args.ticks} ticks, "
+          f"{bot.LOOP_CONCURRENCY} concurrent analyses, {args.send_latency * 1000:.0f}ms per Telegram send")
+    try:
+        ticks = asyncio.run(run())
+    finally:
+        server.should_exit = True
+        thread.join()
+        binance.stop()
+        bot.user_store.close()
+    analyses = sum(info["stats"]["runs"] for info in bot.user_loop_info.values())
+    print(f"  tick        : {throughput(ticks, args.users, 'messages')}")
+    print(f"  delivery    : {percentiles(telegram.latencies)}  (tick start -> message sent)")
+    print(f"  /analyze    : {len(bot.loop_groups) * args.ticks} calls for {analyses} loop runs")
+
+
+def bench_live(args):
+    from ingest import Ingestor
+
+    # Tape ending now, replayed over the stream with some ids dropped; the REST
+    # fake serves the same tape for the backfills
+    now_ms = int(time.time() * 1000)
+    tape = synthetic_tape(args.trades, start_ts=now_ms - 3_600_000, trades_per_sec=args.trades / 3600)
+    tape["T"] -= tape["T"][-1] - now_ms
+    rng = np.random.default_rng(1)
+    drop = rng.choice(tape["a"][1:-1], args.drop, replace=False).tolist()
+    binance = FakeBinance({"BTCUSDT": tape}).start()
+    tool.get_client().API_URL = binance.api_url
+    stream = ReplayStream({"BTCUSDT": tape}, rate=args.rate, drop=drop).start()
+    ingestor = Ingestor(symbols=lambda: {"BTCUSDT"}, url=stream.url, capacity=args.trades)
+    print(f"Replaying {args.trades} trades at {args.rate:,}/s with {args.drop} dropped")
+
+    async def run():
+        task = asyncio.ensure_future(ingestor.run())
+        start = time.perf_counter()
+        while not (stream.finished.is_set() and ingestor.feeds["BTCUSDT"].ring.last_id == int(tape["a"][-1])
+                   and not ingestor.feeds["BTCUSDT"].backfilling):
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        task.cancel()
+        return elapsed
+
+    try:
+        elapsed = asyncio.run(run())
+        ring = ingestor.feeds["BTCUSDT"].ring
+        assert np.array_equal(ring.window(0, now_ms)["a"], tape["a"]), "ring buffer lost or reordered trades"
+        print(f"  ingested    : {elapsed:6.2f}s  {len(ring) / elapsed:>12,.0f} trades/sec  "
+              f"{ingestor.feeds['BTCUSDT'].gaps} gaps backfilled")
+
+        ingestor.connected = True
+        start_ts = now_ms - 30 * 60_000
+        expected = tool.aggregate_trades(tool.slice_columns(
+            tape, int(np.searchsorted(tape["T"], start_ts)), len(tape["a"])), args.whale_threshold)
+        live_time, live = timed(ingestor.volumes, "BTCUSDT", start_ts, now_ms, args.whale_threshold)
+        assert np.allclose(live, expected), (live, expected)
+        print(f"  30m window  : {live_time * 1000:6.2f}ms from the ring buffer")
+    finally:
+        stream.stop()
+        binance.stop()
+
+
+def serve_stub(handshake, urls, connections):
+    """Child process: run a FakeBinance and mirror its connection count."""
+    server = FakeBinance({}, handshake=handshake).start()
+    urls.put(server.url)
+    while True:
+        connections.value = server.connections
+        time.sleep(0.01)
+
+
+def bench_http(args):
+    import httpx
+    import multiprocessing
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+
+    # The stub runs in its own process so it doesn't compete with the clients for the GIL
+    urls, connections = multiprocessing.Queue(), multiprocessing.Value("i", 0)
+    server = multiprocessing.Process(target=serve_stub, args=(args.handshake, urls, connections), daemon=True)
+    server.start()
+    url = urls.get() + "/api/v3/ping"
+    print(f"{args.requests} requests to a local stub, {args.concurrency} concurrent, "
+          f"{args.handshake * 1000:.0f}ms connection setup")
+
+    def measure(run, *fn_args):
+        before = connections.value
+        elapsed = run(*fn_args)
+        time.sleep(0.05)
+        return elapsed, connections.value - before
+
+    def run_threads(get):
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            start = time.perf_counter()
+            list(pool.map(lambda _: get(url).raise_for_status(), range(args.requests)))
+        return time.perf_counter() - start
+
+    async def run_async(client=None):
+        limit = asyncio.Semaphore(args.concurrency)
+
+        async def one():
+            async with limit:
+                if client is None:
+                    async with httpx.AsyncClient() as fresh:
+                        (await fresh.get(url)).raise_for_status()
+                else:
+                    (await client.get(url)).raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(args.requests)))
+        return time.perf_counter() - start
+
+    async def run_shared():
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(limits=limits) as client:
+            return await run_async(client)
+
+    default_session = requests.Session()
+    pooled = tool.pool_session(requests.Session(), args.concurrency)
+    try:
+        results = [
+            ("API -> Binance", "requests.get per call", *measure(run_threads, requests.get)),
+            ("API -> Binance", "default Session", *measure(run_threads, default_session.get)),
+            ("API -> Binance", "pooled Session", *measure(run_threads, pooled.get)),
+            ("bot -> API", "AsyncClient per call", *measure(lambda: asyncio.run(run_async()))),
+            ("bot -> API", "shared AsyncClient", *measure(lambda: asyncio.run(run_shared()))),
+        ]
+    finally:
+        default_session.close()
+        pooled.close()
+        server.terminate()
+    for hop, name, elapsed, connections in results:
+        print(f"  {hop:<15} {name:<22}: {elapsed / args.requests * 1e6:8.0f}us/request  "
+              f"{args.requests / elapsed:8,.0f} req/s  {connections:5} connections")
+
+
+def bench_startup(args):
+    import subprocess
+    import sys
+    import httpx
+
+    env = {**os.environ, "LIVE_INGEST": "0"}
+
+    def in_subprocess(code):
+        """Run ``code`` in a fresh interpreter; it prints a duration in seconds."""
+        out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+        return float(out.stdout.strip().splitlines()[-1])
+
+    def time_to_ready():
+        """Spawn uvicorn and time it until /ready first answers 200."""
+        port = free_port()
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "api:app", "--port", str(port), "--log-level", "warning"],
+                                env=env)
+        try:
+            while True:
+                try:
+                    if httpx.get(f"http://127.0.0.1:{port}/ready", timeout=1).status_code == 200:
+                        return time.perf_counter() - start
+                except httpx.HTTPError:
+                    pass
+                if proc.poll() is not None:
+                    raise RuntimeError("uvicorn exited during startup")
+                time.sleep(0.01)
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    timer = "import time; start = time.perf_counter(); {}; print(time.perf_counter() - start)"
+    cases = [
+        ("import api", lambda: in_subprocess(timer.format("import api"))),
+        ("import bot", lambda: in_subprocess(timer.format("import bot"))),
+        ("spawn -> /ready 200", time_to_ready),
+        ("first LLM use (model + agent)", lambda: in_subprocess(
+            "import agent; " + timer.format("agent.get_agent()"))),
+    ]
+    print(f"Cold start, median of {args.runs} fresh processes")
+    for name, run in cases:
+        samples = [run() for _ in range(args.runs)]
+        print(f"  {name:<30}: {np.median(samples) * 1000:8.0f}ms")
+
+
+def record_tape(args):
+    end_ts = int(time.time() * 1000)
+    start_ts = end_ts - int(args.hours * 3_600_000)
+    symbol = args.symbol.upper()
+    trades = tool.fetch_range_parallel(symbol, start_ts, end_ts)
+    out = args.out or f"{symbol.lower()}.npz"
+    save_tape(out, trades)
+    print(f"\nSaved {len(trades['a']):,} {symbol} trades ({args.hours:g}h) to {out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="suite", required=True)
+
+    agg = sub.add_parser("aggregation", help="per-trade loop vs vectorized aggregation")
+    agg.add_argument("--trades", type=int, default=1_000_000)
+    agg.add_argument("--whale-threshold", type=float, default=100000)
+    agg.set_defaults(func=bench_aggregation)
+
+    fetch = sub.add_parser("fetch", help="sequential vs parallel paging against a fake Binance")
+    fetch.add_argument("--trades", type=int, default=200_000)
+    fetch.add_argument("--latency", type=float, default=0.02, help="seconds per request")
+    fetch.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with 503")
+    fetch.add_argument("--tape", help="captured tape (.npz) to serve instead of synthetic trades")
+    fetch.set_defaults(func=bench_fetch)
+
+    pipeline = sub.add_parser("pipeline", help="fetch_trades, rolling refresh and analyze_sentiment latency")
+    pipeline.add_argument("--trades", type=int, default=1_000_000)
+    pipeline.add_argument("--hours", type=float, default=24, help="span of the synthetic tape")
+    pipeline.add_argument("--tape", help="captured tape (.npz) to serve instead of synthetic trades")
+    pipeline.add_argument("--latency", type=float, default=0.0, help="seconds per fake Binance request")
+    pipeline.add_argument("--repeat", type=int, default=20)
+    pipeline.add_argument("--whale-threshold", type=float, default=100000)
+    pipeline.set_defaults(func=bench_pipeline)
+
+    load = sub.add_parser("load", help="concurrent /analyze latency (fast path, fake Binance)")
+    load.add_argument("--requests", type=int, default=64)
+    load.add_argument("--concurrency", type=int, default=16)
+    load.add_argument("--symbols", type=int, default=8)
+    load.add_argument("--trades-per-symbol", type=int, default=20_000)
+    load.add_argument("--latency", type=float, default=0.01, help="seconds per fake Binance request")
+    load.add_argument("--mode", choices=["auto", "narrative"], default="auto",
+                      help="auto: templated fast path; narrative: agent with the stub LLM")
+    load.add_argument("--llm-latency", type=float, default=0.5, help="seconds per stub LLM call")
+    load.set_defaults(func=bench_load)
+
+    fanout = sub.add_parser("fanout", help="bot loop tick: one analysis per group fanned out to subscribers")
+    fanout.add_argument("--users", type=int, default=200)
+    fanout.add_argument("--groups", type=int, default=20)
+    fanout.add_argument("--ticks", type=int, default=3)
+    fanout.add_argument("--trades-per-symbol", type=int, default=20_000)
+    fanout.add_argument("--latency", type=float, default=0.01, help="seconds per fake Binance request")
+    fanout.add_argument("--send-latency", type=float, default=0.05, help="seconds per Telegram send")
+    fanout.set_defaults(func=bench_fanout)
+
+    live = sub.add_parser("live", help="aggTrade stream ingestion with gap backfill")
+    live.add_argument("--trades", type=int, default=200_000)
+    live.add_argument("--rate", type=int, default=50_000, help="replayed trades per second")
+    live.add_argument("--drop", type=int, default=50, help="trade ids missing from the stream")
+    live.add_argument("--whale-threshold", type=float, default=100000)
+    live.set_defaults(func=bench_live)
+
+    http = sub.add_parser("http", help="per-request overhead of fresh vs pooled HTTP clients")
+    http.add_argument("--requests", type=int, default=2000)
+    http.add_argument("--concurrency", type=int, default=16)
+    http.add_argument("--handshake", type=float, default=0.01, help="seconds of setup per new connection")
+    http.set_defaults(func=bench_http)
+
+    startup = sub.add_parser("startup", help="import and spawn-to-ready time of the API and bot")
+    startup.add_argument("--runs", type=int, default=5)
+    startup.set_defaults(func=bench_startup)
+
+    record = sub.add_parser("record", help="capture a tape from the real Binance API for the other suites")
+    record.add_argument("symbol")
+    record.add_argument("--hours", type=float, default=6)
+    record.add_argument("--out", help="output .npz (default: <symbol>.npz)")
+    record.set_defaults(func=record_tape)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,90 @@
-# bot.py (with JSON persistence for user signals)
+# bot.py (with SQLite persistence for user signals and loops)
 import os
 import re
 import json
+import time
+import random
+import asyncio
 import httpx
 from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
 from dotenv import load_dotenv
+from userdb import UserStore
+from alerts import ALERT_CHECK_INTERVAL, MAX_ALERTS_PER_USER, describe_rule, evaluate, format_alert, initial_armed, parse_rule
+from agent import parse_window
 
 load_dotenv()
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 API_URL = "http://127.0.0.1:8000/analyze"
-
-DATA_FILE = "data/user_data.json"
+STREAM_URL = f"{API_URL}/stream"
+BATCH_URL = f"{API_URL}/batch"
+READY_URL = "http://127.0.0.1:8000/ready"
+API_CONNECTIONS = int(os.getenv("API_CONNECTIONS", "20"))  # keep-alive pool to the API
+API_READY_TIMEOUT = float(os.getenv("API_READY_TIMEOUT", "120"))  # seconds to wait for the API at startup
+PROGRESS_EDIT_INTERVAL = 2  # seconds between in-place progress edits
+
+DEFAULT_WHALE_THRESHOLD = 100000
+
+# Loop scheduling: at most LOOP_CONCURRENCY loop analyses run at once; loops
+# overdue at startup are spread over LOOP_RESTORE_SPREAD seconds, and every
+# restored group gets up to LOOP_JITTER seconds of random delay
+LOOP_CONCURRENCY = int(os.getenv("LOOP_CONCURRENCY", "4"))
+LOOP_RESTORE_SPREAD = float(os.getenv("LOOP_RESTORE_SPREAD", "60"))
+LOOP_JITTER = 5
 
 # Runtime data
-user_signals = {}   # persists in JSON
-user_jobs = {}      # runtime only
-user_loop_info = {} # runtime only
-
-# -------- JSON PERSISTENCE -------- #
-def ensure_data_directory():
-    """Ensure the data directory exists"""
-    data_dir = os.path.dirname(DATA_FILE)
-    if data_dir and not os.path.exists(data_dir):
-        os.makedirs(data_dir, exist_ok=True)
-
+user_store = None   # UserStore, opened in main()
+api_client = None   # shared httpx.AsyncClient, opened in post_init
+user_signals = {}   # persists in user_store
+user_loop_info = {} # persists in user_store (loops table)
+loop_groups = {}    # runtime only: (symbol, timeframe, whale_threshold) -> shared loop
+user_alerts = {}    # persists in user_store (alerts table): user_id -> [alert rule]
+loop_slots = asyncio.Semaphore(LOOP_CONCURRENCY)
+
+# -------- PERSISTENCE -------- #
 def load_user_data():
-    global user_signals
-    ensure_data_directory()  # Ensure directory exists
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, "r") as f:
-                user_signals = json.load(f)
-        except Exception:
-            user_signals = {}
-    else:
-        user_signals = {}
+    """Open the user store (migrating user_data.json on first run) and load the signals and alerts."""
+    global user_store, user_signals, user_alerts
+    user_store = UserStore()
+    user_signals = user_store.signals()
+    user_alerts = user_store.alerts()
+
+def save_signal(user_id):
+    user_store.save_signal(user_id, user_signals[user_id])
+
+def save_loop(user_id):
+    info = user_loop_info[user_id]
+    user_store.save_loop(user_id, {**info, "next_run": info["next_run"].timestamp()})
+
+def restore_loops(job_queue):
+    """
+    Re-subscribe the loops persisted before the last shutdown. Each group's
+    first pass lands on its earliest next run (plus jitter); groups that fell
+    due while the bot was down are spread over LOOP_RESTORE_SPREAD instead
+    of all firing at once. Later passes follow the subscribers' next runs.
+    """
+    loops = user_store.loops()
+    for user_id, loop in loops.items():
+        subscribe_loop(job_queue, user_id, loop, loop["interval"], loop["interval_str"],
+                       next_run=datetime.fromtimestamp(loop["next_run"]), schedule=False)
 
-def save_user_data():
-    ensure_data_directory()  # Ensure directory exists before saving
-    with open(DATA_FILE, "w") as f:
-        json.dump(user_signals, f, indent=4)
+    now = datetime.now()
+    due_in = {
+        key: (min(user_loop_info[uid]["next_run"] for uid in group["subscribers"]) - now).total_seconds()
+        for key, group in loop_groups.items()
+    }
+    overdue = [key for key, seconds in due_in.items() if seconds <= 0]
+    random.shuffle(overdue)
+    for key, seconds in due_in.items():
+        if seconds <= 0:
+            first = overdue.index(key) * LOOP_RESTORE_SPREAD / len(overdue)
+        else:
+            first = seconds
+        reschedule_group(job_queue, key, first=first + random.uniform(0, LOOP_JITTER))
+    if loops:
+        print(f"Restored {len(loops)} loops in {len(loop_groups)} groups ({len(overdue)} overdue)")
 
 # -------- UI HELPERS -------- #
 def main_menu():
@@ -52,7 +95,16 @@ def main_menu():
         [InlineKeyboardButton("🔁 Resend Signal", callback_data="resend_signal")],
         [InlineKeyboardButton("⏲ Enable Loop", callback_data="enable_loop")],
         [InlineKeyboardButton("📊 Loop Status", callback_data="loop_status")],
-        [InlineKeyboardButton("🛑 Stop Loop", callback_data="stop_loop")]
+        [InlineKeyboardButton("🛑 Stop Loop", callback_data="stop_loop")],
+        [InlineKeyboardButton("🔔 Alerts", callback_data="alerts")]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+def alerts_menu():
+    keyboard = [
+        [InlineKeyboardButton("➕ Add Alert", callback_data="add_alert")],
+        [InlineKeyboardButton("🔕 Clear Alerts", callback_data="clear_alerts")],
+        [InlineKeyboardButton("⬅️ Back", callback_data="back")]
     ]
     return InlineKeyboardMarkup(keyboard)
 
@@ -82,7 +134,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    user_id = str(query.from_user.id)  # string for JSON keys
+    user_id = str(query.from_user.id)  # string ids, as stored in user_store
 
     if query.data == "set_symbol":
         await query.edit_message_text("Send me the trading symbol (e.g., BTCUSDT).", reply_markup=back_button())
@@ -98,7 +150,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "symbol": context.user_data["symbol"],
                 "timeframe": context.user_data["timeframe"],
             }
-            save_user_data()  # persist to JSON
+            save_signal(user_id)
             await query.edit_message_text(f"✅ Saved signal: {user_signals[user_id]}", reply_markup=main_menu())
         else:
             await query.edit_message_text("⚠️ Please set symbol & timeframe first.", reply_markup=main_menu())
@@ -129,7 +181,8 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"📈 Symbol: {info['symbol']} ({info['timeframe']})\n"
                 f"⏱ Interval: Every {info['interval_str']}\n"
                 f"➡️ Next run: {info['next_run'].strftime('%Y-%m-%d %H:%M:%S')}\n"
-                f"🕐 Time until next: {format_time_until(info['next_run'])}"
+                f"🕐 Time until next: {format_time_until(info['next_run'])}\n\n"
+                f"{format_loop_stats(info['stats'])}"
             )
         else:
             status_text = "📊 Loop Status: INACTIVE ❌\n\nNo loop is currently running."
@@ -137,14 +190,37 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text(status_text, reply_markup=main_menu())
 
     elif query.data == "stop_loop":
-        if user_id in user_jobs:
-            user_jobs[user_id].schedule_removal()
-            del user_jobs[user_id]
-            user_loop_info.pop(user_id, None)
+        if unsubscribe_loop(context.job_queue, user_id):
             await query.edit_message_text("🛑 Loop stopped.", reply_markup=main_menu())
         else:
             await query.edit_message_text("⚠️ No loop is running.", reply_markup=main_menu())
 
+    elif query.data == "alerts":
+        await query.edit_message_text(alerts_text(user_id), reply_markup=alerts_menu())
+
+    elif query.data == "add_alert":
+        signal = user_signals.get(user_id)
+        if not signal:
+            await query.edit_message_text("⚠️ Save a signal first.", reply_markup=main_menu())
+        elif len(user_alerts.get(user_id, [])) >= MAX_ALERTS_PER_USER:
+            await query.edit_message_text(f"⚠️ At most {MAX_ALERTS_PER_USER} alerts.", reply_markup=alerts_menu())
+        elif parse_window(signal["timeframe"]) is None:
+            await query.edit_message_text(alert_timeframe_error(signal), reply_markup=main_menu())
+        else:
+            await query.edit_message_text(
+                f"🔔 New alert for {signal['symbol']} ({signal['timeframe']}). Send a rule, e.g.:\n"
+                f"• whale > 0.3\n• retail below -0.2\n• divergence above 0.5 narrative\n\n"
+                f"Indices range from -1 to +1; divergence is whale minus retail. "
+                f"Add \"narrative\" to get an AI analysis with the alert.",
+                reply_markup=back_button()
+            )
+            context.user_data["awaiting"] = "alert_rule"
+
+    elif query.data == "clear_alerts":
+        user_alerts.pop(user_id, None)
+        user_store.delete_alerts(user_id)
+        await query.edit_message_text("🔕 Alerts cleared.", reply_markup=main_menu())
+
     elif query.data.startswith("loop_"):
         signal = user_signals.get(user_id)
         if signal:
@@ -207,32 +283,114 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         context.user_data["awaiting"] = None
 
+    elif awaiting == "alert_rule":
+        rule = parse_rule(update.message.text)
+        signal = user_signals.get(user_id)
+        if rule is None:
+            await update.message.reply_text("⚠️ Invalid rule. Try e.g. \"whale > 0.3\":", reply_markup=back_button())
+            return
+        if signal and parse_window(signal["timeframe"]) is None:
+            await update.message.reply_text(alert_timeframe_error(signal), reply_markup=main_menu())
+        elif signal:
+            # Seed the debounce state from the current value, so a condition
+            # that already holds doesn't fire on the first check
+            symbol, timeframe, whale_threshold = loop_key(signal)
+            rows = await fetch_indices(timeframe, whale_threshold, [symbol])
+            alert = {**signal, **rule, "armed": initial_armed(rule, rows.get(symbol)), "last_fired": None}
+            alert["id"] = user_store.add_alert(user_id, alert)
+            user_alerts.setdefault(user_id, []).append(alert)
+            await update.message.reply_text(f"✅ Alert set: {alert['symbol']} {alert['timeframe']}: {describe_rule(alert)}",
+                                            reply_markup=main_menu())
+        else:
+            await update.message.reply_text("⚠️ Save a signal first.", reply_markup=main_menu())
+        context.user_data["awaiting"] = None
+
     else:
         await update.message.reply_text("Use /start to configure signals.")
 
 # -------- LOOP MANAGEMENT -------- #
-async def start_loop_with_interval(query, context, user_id, signal, interval, interval_str):
-    """Start a loop with the specified interval"""
-    query_str = f"{signal['symbol']} {signal['timeframe']}"
-    
-    # Stop existing loop if any
-    if user_id in user_jobs:
-        user_jobs[user_id].schedule_removal()
-    
-    # Start new loop
-    job = context.job_queue.run_repeating(
-        loop_task, interval=interval, first=0,
-        chat_id=int(user_id), data=query_str
+# Loops are grouped by (symbol, timeframe, whale_threshold). Each group has a
+# single one-off job set for its earliest subscriber's next run; a pass runs
+# one analysis, sends it to every subscriber that is due, and sets the next job.
+def loop_key(signal):
+    return (
+        signal["symbol"].upper(),
+        signal["timeframe"].strip().lower(),
+        signal.get("whale_threshold", DEFAULT_WHALE_THRESHOLD),
     )
-    user_jobs[user_id] = job
-    next_run = datetime.now() + timedelta(seconds=interval)
+
+def loop_query(key):
+    symbol, timeframe, whale_threshold = key
+    query_str = f"{symbol} {timeframe}"
+    if whale_threshold != DEFAULT_WHALE_THRESHOLD:
+        query_str += f" whale threshold {whale_threshold}"
+    return query_str
+
+def reschedule_group(job_queue, key, first=None):
+    """
+    (Re)schedule a group's next pass: at its subscribers' earliest next run,
+    or after ``first`` seconds.
+    """
+    group = loop_groups.get(key)
+    if group is None:
+        return
+    if group["job"] is not None:
+        group["job"].schedule_removal()
+        group["job"] = None
+    if not group["subscribers"]:
+        del loop_groups[key]
+        return
+
+    if first is None:
+        next_run = min(user_loop_info[uid]["next_run"] for uid in group["subscribers"])
+        first = max((next_run - datetime.now()).total_seconds(), 0)
+    group["job"] = job_queue.run_once(loop_task, first, data=key)
+
+def subscribe_loop(job_queue, user_id, signal, interval, interval_str, next_run=None, schedule=True):
+    """
+    Add a user to the loop group of ``signal``. Without ``next_run`` (a new
+    loop) the first analysis runs right away and the loop is persisted.
+    With ``schedule=False`` the group's job is left to the caller.
+    """
+    unsubscribe_loop(job_queue, user_id, forget=next_run is None)
+    key = loop_key(signal)
     user_loop_info[user_id] = {
-        "interval": interval, 
-        "next_run": next_run,
+        "interval": interval,
+        "next_run": next_run or datetime.now(),
         "interval_str": interval_str,
         "symbol": signal['symbol'],
-        "timeframe": signal['timeframe']
+        "timeframe": signal['timeframe'],
+        "whale_threshold": signal.get("whale_threshold"),
+        "group": key,
+        # Scheduling metrics: runs, ticks coalesced away, lateness and run time (seconds)
+        "stats": {"runs": 0, "skipped": 0, "overdue": 0.0, "max_overdue": 0.0, "duration": 0.0, "max_duration": 0.0},
     }
+    group = loop_groups.setdefault(key, {"subscribers": set(), "job": None, "running": False, "rerun": False})
+    group["subscribers"].add(user_id)
+    if schedule:
+        reschedule_group(job_queue, key)
+
+    if next_run is None:
+        # Due now: the group's next pass runs right away, shared with anyone else already due
+        save_loop(user_id)
+
+def unsubscribe_loop(job_queue, user_id, forget=True):
+    """Remove a user's loop (and, with ``forget``, its persisted row); returns False if none was running."""
+    info = user_loop_info.pop(user_id, None)
+    if info is None:
+        return False
+    if forget:
+        user_store.delete_loop(user_id)
+    group = loop_groups.get(info["group"])
+    if group is not None:
+        group["subscribers"].discard(user_id)
+        reschedule_group(job_queue, info["group"])
+    return True
+
+async def start_loop_with_interval(query, context, user_id, signal, interval, interval_str):
+    """Start a loop with the specified interval"""
+    subscribe_loop(context.job_queue, user_id, signal, interval, interval_str)
+    next_run = datetime.now() + timedelta(seconds=interval)
     
     await query.edit_message_text(
         f"🔁 Loop enabled!\n"
@@ -243,28 +401,187 @@ async def start_loop_with_interval(query, context, user_id, signal, interval, in
     )
 
 # -------- ANALYSIS -------- #
+async def fetch_analysis(query_str, mode="auto"):
+    try:
+        response = await api_client.post(API_URL, json={"query": query_str, "mode": mode}, timeout=1000.0)
+        data = response.json()
+        return data.get("result", "⚠️ No response from AI agent.")
+    except Exception as e:
+        return f"❌ Error: {e}"
+
+def progress_text(query_str, progress, partial):
+    text = f"⏳ Analyzing {query_str}..."
+    if progress:
+        text += f"\n📥 Fetched {progress['done']}/{progress['total']} chunks"
+    if partial:
+        text += (
+            f"\n\nSo far ({partial['trades']:,} trades):"
+            f"\n• Retail index: {partial['sentiment_index']:+.3f}"
+            f"\n• Whale index: {partial['whale_sentiment_index']:+.3f}"
+        )
+    return text
+
+async def edit_text(message, text):
+    try:
+        await message.edit_text(text)
+    except BadRequest:
+        pass  # e.g. "message is not modified"
+
 async def send_analysis(chat_id, context, query_str):
+    """Stream an analysis, editing one message in place as progress arrives."""
+    message = await context.bot.send_message(chat_id=chat_id, text=f"⏳ Analyzing {query_str}...")
+    result = "⚠️ No response from AI agent."
+    progress = partial = None
+    last_edit = time.monotonic()
     try:
-        async with httpx.AsyncClient(timeout=1000.0) as client:
-            response = await client.post(API_URL, json={"query": query_str})
-            data = response.json()
-            result = data.get("result", "⚠️ No response from AI agent.")
+        # The stream sends heartbeats, so a quiet minute means the API is gone
+        timeout = httpx.Timeout(60.0, connect=15.0)
+        async with api_client.stream("POST", STREAM_URL, json={"query": query_str}, timeout=timeout) as response:
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["event"] in ("result", "error"):
+                    result = event["result"]
+                    continue
+                if event["event"] == "progress":
+                    progress = event
+                elif event["event"] == "partial":
+                    partial = event
+                if time.monotonic() - last_edit >= PROGRESS_EDIT_INTERVAL:
+                    await edit_text(message, progress_text(query_str, progress, partial))
+                    last_edit = time.monotonic()
     except Exception as e:
         result = f"❌ Error: {e}"
-    await context.bot.send_message(chat_id=chat_id, text=result)
+    await edit_text(message, result)
 
 async def loop_task(context: ContextTypes.DEFAULT_TYPE):
-    query_str = context.job.data
-    user_id = str(context.job.chat_id)
-    
-    # Send analysis
-    await send_analysis(context.job.chat_id, context, query_str)
-    
-    # Update next run time if user still has loop info
-    if user_id in user_loop_info:
-        user_loop_info[user_id]["next_run"] = datetime.now() + timedelta(
-            seconds=user_loop_info[user_id]["interval"]
-        )
+    key = context.job.data
+    group = loop_groups.get(key)
+    if group is None:
+        return
+    if group["job"] is context.job:
+        group["job"] = None  # fired: nothing left to remove
+    if group["running"]:
+        group["rerun"] = True  # coalesce with the run in progress: one more pass when it ends
+        return
+
+    group["running"] = True
+    try:
+        # Global cap on concurrent loop analyses; lateness includes this wait
+        async with loop_slots:
+            group["rerun"] = True
+            while group["rerun"]:
+                group["rerun"] = False
+                await run_loop_group(context, key, group)
+    finally:
+        group["running"] = False
+        reschedule_group(context.job_queue, key)
+
+async def run_loop_group(context, key, group):
+    now = datetime.now()
+    due = [uid for uid in group["subscribers"] if user_loop_info[uid]["next_run"] <= now + timedelta(seconds=1)]
+    if not due:
+        return
+    for uid in due:
+        info = user_loop_info[uid]
+        info["stats"]["overdue"] = overdue = max((now - info["next_run"]).total_seconds(), 0.0)
+        info["stats"]["max_overdue"] = max(info["stats"]["max_overdue"], overdue)
+        # Coalesce missed ticks into this one run rather than replaying them
+        missed = -1
+        while info["next_run"] <= now + timedelta(seconds=1):  # tolerate scheduler jitter
+            info["next_run"] += timedelta(seconds=info["interval"])
+            missed += 1
+        info["stats"]["skipped"] += missed
+    user_store.set_next_runs({uid: user_loop_info[uid]["next_run"].timestamp() for uid in due})
+
+    # One analysis for the whole group, fanned out to every due subscriber
+    started = time.monotonic()
+    result = await fetch_analysis(loop_query(key))
+    duration = time.monotonic() - started
+    for uid in due:
+        if uid in user_loop_info:
+            stats = user_loop_info[uid]["stats"]
+            stats["runs"] += 1
+            stats["duration"] = duration
+            stats["max_duration"] = max(stats["max_duration"], duration)
+    for uid in due:
+        if uid not in user_loop_info:
+            continue  # stopped while the analysis was running
+        try:
+            await context.bot.send_message(chat_id=int(uid), text=result)
+        except Exception as e:
+            print(f"Failed to send loop update to {uid}: {e}")
+
+# -------- ALERTS -------- #
+# Rules are checked every ALERT_CHECK_INTERVAL on numeric indices only: one
+# /analyze/batch call per (timeframe, whale threshold) covers every symbol,
+# and the API answers it from its rolling or live state, without the LLM.
+ALERT_BATCH_SIZE = 50  # the API's default BATCH_MAX_SYMBOLS
+
+def alerts_text(user_id):
+    alerts = user_alerts.get(user_id, [])
+    if not alerts:
+        return "🔔 No alerts set.\n\nAlerts message you only when a rule on your saved signal is met."
+    lines = [f"{i}. {a['symbol']} {a['timeframe']}: {describe_rule(a)}" for i, a in enumerate(alerts, 1)]
+    return f"🔔 Alerts (checked every {ALERT_CHECK_INTERVAL}s):\n\n" + "\n".join(lines)
+
+def alert_timeframe_error(signal):
+    return (f"⚠️ Alerts can't check a {signal['timeframe']} timeframe. Save a signal with a timeframe "
+            f"in minutes, hours, days or weeks (e.g. 4h) first.")
+
+async def fetch_indices(timeframe, whale_threshold, symbols):
+    """Batch rows for ``symbols`` over one window, ``{symbol: row}`` (empty on error)."""
+    rows = {}
+    for i in range(0, len(symbols), ALERT_BATCH_SIZE):
+        body = {"symbols": symbols[i:i + ALERT_BATCH_SIZE], "window": timeframe, "whale_threshold": whale_threshold}
+        try:
+            response = await api_client.post(BATCH_URL, json=body, timeout=300.0)
+            response.raise_for_status()
+            rows.update((row["symbol"], row) for row in response.json()["rows"])
+        except Exception as e:
+            print(f"Alert check of {timeframe} failed: {e}")
+    return rows
+
+async def check_alerts(context: ContextTypes.DEFAULT_TYPE):
+    windows = {}
+    for alerts in user_alerts.values():
+        for alert in alerts:
+            symbol, timeframe, whale_threshold = loop_key(alert)
+            windows.setdefault((timeframe, whale_threshold), set()).add(symbol)
+    if not windows:
+        return
+    results = await asyncio.gather(*(fetch_indices(timeframe, whale_threshold, sorted(symbols))
+                                     for (timeframe, whale_threshold), symbols in windows.items()))
+    rows = {(symbol, *window): row for window, window_rows in zip(windows, results) for symbol, row in window_rows.items()}
+
+    now = time.time()
+    fired, changed = [], []
+    for user_id, alerts in user_alerts.items():
+        for alert in alerts:
+            row = rows.get(loop_key(alert))
+            if row is None:
+                continue
+            state = (alert["armed"], alert["last_fired"])
+            if evaluate(alert, row, now):
+                fired.append((user_id, alert, row))
+            if (alert["armed"], alert["last_fired"]) != state:
+                changed.append(alert)
+    if changed:
+        user_store.set_alert_states(changed)
+
+    narratives = {}  # one LLM analysis per signal, shared by everyone it fired for
+    for user_id, alert, row in fired:
+        text = format_alert(alert, row)
+        if alert["narrative"]:
+            query_str = loop_query(loop_key(alert))
+            if query_str not in narratives:
+                narratives[query_str] = await fetch_analysis(query_str, mode="narrative")
+            text += "\n\n" + narratives[query_str]
+        try:
+            await context.bot.send_message(chat_id=int(user_id), text=text)
+        except Exception as e:
+            print(f"Failed to send alert to {user_id}: {e}")
 
 # -------- UTILS -------- #
 def timeframe_to_seconds(tf: str):
@@ -279,6 +596,13 @@ def timeframe_to_seconds(tf: str):
     }
     return value * multipliers.get(unit, 0)
 
+def format_loop_stats(stats):
+    return (
+        f"🧮 Runs: {stats['runs']} · skipped ticks: {stats['skipped']}\n"
+        f"⏰ Late by: {stats['overdue']:.1f}s (max {stats['max_overdue']:.1f}s)\n"
+        f"⌛ Run time: {stats['duration']:.1f}s (max {stats['max_duration']:.1f}s)"
+    )
+
 def format_time_until(target_time):
     """Format time remaining until target time"""
     now = datetime.now()
@@ -307,13 +631,47 @@ def format_time_until(target_time):
         return f"{days} day{'s' if days != 1 else ''}"
 
 # -------- MAIN -------- #
+async def wait_for_api():
+    """Poll the API's /ready until it answers, up to API_READY_TIMEOUT."""
+    started = time.monotonic()
+    delay = 0.1
+    while True:
+        try:
+            response = await api_client.get(READY_URL, timeout=2.0)
+            if response.status_code == 200:
+                print(f"API ready after {time.monotonic() - started:.1f}s")
+                return
+        except httpx.HTTPError:
+            pass
+        if time.monotonic() - started > API_READY_TIMEOUT:
+            print(f"API not ready after {API_READY_TIMEOUT:g}s, starting anyway")
+            return
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 2.0)
+
+async def post_init(app):
+    global api_client
+    # One pooled client for every bot -> API request, kept alive between calls
+    limits = httpx.Limits(max_connections=API_CONNECTIONS, max_keepalive_connections=API_CONNECTIONS)
+    api_client = httpx.AsyncClient(limits=limits, timeout=60.0)
+    await wait_for_api()  # restored loops call the API right away
+    restore_loops(app.job_queue)
+    app.job_queue.run_repeating(check_alerts, interval=ALERT_CHECK_INTERVAL, first=ALERT_CHECK_INTERVAL)
+
+async def post_shutdown(app):
+    if api_client is not None:
+        await api_client.aclose()
+    user_store.close()
+
 def main():
-    load_user_data()  # load from JSON at startup
+    load_user_data()  # load from SQLite at startup
 
     app = Application.builder() \
         .token(BOT_TOKEN) \
         .connect_timeout(15) \
         .read_timeout(15) \
+        .post_init(post_init) \
+        .post_shutdown(post_shutdown) \
         .build()
 
     app.job_queue  # ensure job queue
@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# TTL = window length * ratio, clamped: a 1d answer may be served stale for
+# longer than a 5m one
+CACHE_TTL_RATIO = float(os.getenv("CACHE_TTL_RATIO", "0.01"))
+CACHE_TTL_MIN = float(os.getenv("CACHE_TTL_MIN", "5"))
+CACHE_TTL_MAX = float(os.getenv("CACHE_TTL_MAX", "600"))
+
+
+def ttl_for_window(seconds):
+    """How long a result for a window of ``seconds`` may be reused."""
+    return min(max(seconds * CACHE_TTL_RATIO, CACHE_TTL_MIN), CACHE_TTL_MAX)
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a per-entry TTL."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
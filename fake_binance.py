@@ -0,0 +1,283 @@
+"""
+Local fake of the Binance endpoints used by the pipeline.
+
+Serves aggTrade tapes over HTTP (and replays them over a WebSocket stream) so
+fetching and live ingestion can be exercised and benchmarked without touching
+the real exchange. Tapes are synthetic or captured from Binance (see
+``bench.py record``) and saved with save_tape:
+
+    server = FakeBinance({"BTCUSDT": synthetic_tape(1_000_000)}).start()
+    tool.get_client().API_URL = server.api_url
+    ...
+    server.stop()
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+
+from store import COLUMNS
+
+AGG_TRADES_WEIGHT = 4
+KLINES_WEIGHT = 2
+INTERVAL_MS = {"1m": 60_000, "5m": 300_000, "15m": 900_000, "1h": 3_600_000, "4h": 14_400_000, "1d": 86_400_000}
+
+
+def synthetic_tape(count, start_ts=1_700_000_000_000, trades_per_sec=20, seed=0):
+    """Generate ``count`` aggTrades as trade columns, with a few whale-sized fills."""
+    rng = np.random.default_rng(seed)
+    gaps = rng.exponential(1000 / trades_per_sec, count).astype(np.int64)
+    price = 100 * np.exp(np.cumsum(rng.normal(0, 1e-4, count)))
+    qty = rng.lognormal(2, 1.5, count)
+    return {
+        "a": np.arange(1, count + 1, dtype=np.int64),
+        "T": start_ts + np.cumsum(gaps),
+        "p": np.round(price, 4),
+        "q": np.round(qty, 5),
+        "m": rng.random(count) < 0.5,
+    }
+
+
+def save_tape(path, tape):
+    """Write a tape (trade columns) to an ``.npz`` file."""
+    np.savez_compressed(path, **tape)
+
+
+def load_tape(path, end_ts=None):
+    """Read a tape saved by save_tape, shifting its timestamps to end at ``end_ts`` if given."""
+    with np.load(path) as data:
+        tape = {name: data[name].astype(dtype) for name, dtype in COLUMNS.items()}
+    if end_ts is not None:
+        tape["T"] += end_ts - tape["T"][-1]
+    return tape
+
+
+class FakeBinance:
+    """Threaded HTTP server answering /api/v3/ping, /api/v3/aggTrades and /api/v3/klines."""
+
+    def __init__(self, tapes, latency=0.0, weight_limit=6000, error_rate=0.0, handshake=0.0, host="127.0.0.1", port=0):
+        self.tapes = {symbol: {name: np.asarray(col, dtype=COLUMNS[name]) for name, col in tape.items()}
+                      for symbol, tape in tapes.items()}
+        self.latency = latency
+        self.weight_limit = weight_limit
+        self.error_rate = error_rate
+        self.handshake = handshake  # extra delay per new connection, standing in for TCP/TLS setup
+        self.connections = 0
+        self.requests = 0
+        self.rejected = 0
+        self._weight = 0
+        self._minute = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self):
+        """Value for ``binance.client.Client.API_URL``."""
+        return self.url + "/api"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # -------- REQUEST HANDLING -------- #
+    def _use_weight(self, weight):
+        """Account request weight; returns the used weight or None if over the limit."""
+        with self._lock:
+            self.requests += 1
+            minute = int(time.time() // 60)
+            if minute != self._minute:
+                self._minute, self._weight = minute, 0
+            if self._weight + weight > self.weight_limit:
+                self.rejected += 1
+                return None
+            self._weight += weight
+            return self._weight
+
+    def agg_trades(self, params):
+        """Return ``(status, body)`` for an aggTrades query."""
+        tape = self.tapes.get(params.get("symbol", "").upper())
+        if tape is None:
+            return 400, {"code": -1121, "msg": "Invalid symbol."}
+
+        limit = min(int(params.get("limit", 500)), 1000)
+        if "fromId" in params:
+            start = int(np.searchsorted(tape["a"], int(params["fromId"]), side="left"))
+            stop = start + limit
+        else:
+            start_ts, end_ts = int(params["startTime"]), int(params["endTime"])
+            if end_ts - start_ts >= 60 * 60 * 1000:
+                return 400, {"code": -1127, "msg": "More than 1 hours between startTime and endTime."}
+            start = int(np.searchsorted(tape["T"], start_ts, side="left"))
+            stop = min(start + limit, int(np.searchsorted(tape["T"], end_ts, side="right")))
+
+        rows = zip(tape["a"][start:stop].tolist(), tape["p"][start:stop].tolist(), tape["q"][start:stop].tolist(),
+                   tape["T"][start:stop].tolist(), tape["m"][start:stop].tolist())
+        return 200, [
+            {"a": a, "p": f"{p:.8f}", "q": f"{q:.8f}", "f": a, "l": a, "T": t, "m": m, "M": True}
+            for a, p, q, t, m in rows
+        ]
+
+    def klines(self, params):
+        """Return ``(status, body)`` for a klines query, built from the tape."""
+        tape = self.tapes.get(params.get("symbol", "").upper())
+        if tape is None:
+            return 400, {"code": -1121, "msg": "Invalid symbol."}
+        interval = INTERVAL_MS.get(params.get("interval"))
+        if interval is None:
+            return 400, {"code": -1120, "msg": "Invalid interval."}
+
+        limit = min(int(params.get("limit", 500)), 1000)
+        start_ts = int(params.get("startTime", tape["T"][0]))
+        end_ts = int(params.get("endTime", tape["T"][-1]))
+        first_open = -(-start_ts // interval) * interval
+        start = int(np.searchsorted(tape["T"], first_open, side="left"))
+        stop = int(np.searchsorted(tape["T"], end_ts, side="right"))
+        times, price, qty = tape["T"][start:stop], tape["p"][start:stop], tape["q"][start:stop]
+        buys = ~tape["m"][start:stop]
+
+        rows = []
+        opens, first = np.unique(times // interval * interval, return_index=True)
+        bounds = first.tolist() + [len(times)]
+        for i, open_time in enumerate(opens[:limit].tolist()):
+            s, e = bounds[i], bounds[i + 1]
+            p, q, b = price[s:e], qty[s:e], buys[s:e]
+            rows.append([
+                open_time, f"{p[0]:.8f}", f"{p.max():.8f}", f"{p.min():.8f}", f"{p[-1]:.8f}",
+                f"{q.sum():.8f}", open_time + interval - 1, f"{(p * q).sum():.8f}", e - s,
+                f"{q[b].sum():.8f}", f"{(p[b] * q[b]).sum():.8f}", "0",
+            ])
+        return 200, rows
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake.connections += 1
+                if fake.handshake:
+                    time.sleep(fake.handshake)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                if url.path == "/api/v3/ping":
+                    return self._reply(200, {})
+                routes = {
+                    "/api/v3/aggTrades": (fake.agg_trades, AGG_TRADES_WEIGHT),
+                    "/api/v3/klines": (fake.klines, KLINES_WEIGHT),
+                }
+                if url.path not in routes:
+                    return self._reply(404, {"code": -1, "msg": "Not found"})
+                route, weight = routes[url.path]
+
+                used = fake._use_weight(weight)
+                if used is None:
+                    return self._reply(429, {"code": -1003, "msg": "Too many requests."}, {"Retry-After": "1"})
+                if fake.error_rate and random.random() < fake.error_rate:
+                    return self._reply(503, {"code": -1001, "msg": "Internal error."})
+                status, body = route(params)
+                self._reply(status, body, {"X-MBX-USED-WEIGHT-1M": str(used)})
+
+            def _reply(self, status, body, headers=None):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class ReplayStream:
+    """
+    WebSocket server replaying tapes as a combined aggTrade stream
+    (``/stream?streams=btcusdt@aggTrade/...``), ``rate`` messages per second.
+    Trade ids in ``drop`` are skipped to simulate lost messages.
+    """
+
+    def __init__(self, tapes, rate=10_000, drop=(), host="127.0.0.1", port=0):
+        self.tapes = tapes
+        self.rate = rate
+        self.drop = set(drop)
+        self.sent = 0
+        self.finished = threading.Event()
+        self._host, self._port = host, port
+        self._ready = threading.Event()
+        self._loop = self._server = None
+
+    @property
+    def url(self):
+        return f"ws://{self._host}:{self._port}"
+
+    def start(self):
+        threading.Thread(target=self._serve, daemon=True).start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._server.close)
+
+    def _serve(self):
+        import asyncio
+        from websockets.asyncio.server import serve
+
+        async def main():
+            self._loop = asyncio.get_running_loop()
+            async with serve(self._replay, self._host, self._port) as server:
+                self._server = server
+                self._port = server.sockets[0].getsockname()[1]
+                self._ready.set()
+                await server.wait_closed()
+
+        asyncio.run(main())
+
+    async def _replay(self, connection):
+        import asyncio
+
+        query = parse_qs(urlparse(connection.request.path).query)
+        symbols = [stream.split("@")[0].upper() for stream in query.get("streams", [""])[0].split("/")]
+        tapes = [(symbol, self.tapes[symbol]) for symbol in symbols if symbol in self.tapes]
+        batch = max(1, self.rate // 100)
+        for symbol, tape in tapes:
+            stream = f"{symbol.lower()}@aggTrade"
+            rows = zip(tape["a"].tolist(), tape["p"].tolist(), tape["q"].tolist(), tape["T"].tolist(), tape["m"].tolist())
+            for i, (a, p, q, t, m) in enumerate(rows):
+                if a not in self.drop:
+                    await connection.send(json.dumps({"stream": stream, "data": {
+                        "e": "aggTrade", "E": t, "s": symbol, "a": a, "p": f"{p:.8f}", "q": f"{q:.8f}",
+                        "f": a, "l": a, "T": t, "m": m, "M": True,
+                    }}))
+                    self.sent += 1
+                if i % batch == batch - 1:
+                    await asyncio.sleep(0.01)
+        self.finished.set()
+        await connection.wait_closed()
@@ -0,0 +1,160 @@
+"""
+Sentiment time series from persisted per-minute rollups.
+
+Each closed minute's buy, sell, whale buy and whale sell volume is computed
+once, from the trade store or straight from Binance, and kept in SQLite, so a series at any resolution
+is a GROUP BY over stored minutes rather than a rescan of raw trades.
+"""
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+from store import get_store
+from tool import MINUTE_MS, analyze_sentiment, fetch_range_parallel, minute_buckets
+
+ROLLUP_DB_FILE = os.getenv("ROLLUP_DB_FILE", "data/rollups.db")
+
+# Resolution -> minutes per point
+RESOLUTIONS = {"1m": 1, "5m": 5, "1h": 60}
+
+# Minutes downloaded and rolled up at a time when the trade store doesn't hold them
+FETCH_CHUNK_MINUTES = 360
+
+# A minute is rolled up only once it has been closed this long, so trades
+# Binance hasn't published yet don't leave a stored minute short for good
+ROLLUP_SETTLE_MS = int(float(os.getenv("ROLLUP_SETTLE_SECONDS", "30")) * 1000)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS minute_volumes (
+    symbol          TEXT NOT NULL,
+    whale_threshold REAL NOT NULL,
+    minute          INTEGER NOT NULL,  -- unix time // 60
+    buy             REAL NOT NULL,
+    sell            REAL NOT NULL,
+    whale_buy       REAL NOT NULL,
+    whale_sell      REAL NOT NULL,
+    PRIMARY KEY (symbol, whale_threshold, minute)
+) WITHOUT ROWID;
+"""
+
+
+class RollupStore:
+    """Per-minute volume rollups, one row per (symbol, whale threshold, minute)."""
+
+    def __init__(self, path=ROLLUP_DB_FILE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def missing(self, symbol, whale_threshold, first, last):
+        """Runs ``(start, end)`` of minutes in ``[first, last]`` without a rollup."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT minute FROM minute_volumes WHERE symbol = ? AND whale_threshold = ? AND minute BETWEEN ? AND ?",
+                (symbol, whale_threshold, first, last),
+            ).fetchall()
+        have = np.array([row[0] for row in rows], dtype=np.int64)
+        absent = np.setdiff1d(np.arange(first, last + 1, dtype=np.int64), have)
+        if not len(absent):
+            return []
+        breaks = np.flatnonzero(np.diff(absent) > 1)
+        starts = np.concatenate([absent[:1], absent[breaks + 1]])
+        ends = np.concatenate([absent[breaks], absent[-1:]])
+        return list(zip(starts.tolist(), ends.tolist()))
+
+    def save(self, symbol, whale_threshold, minutes, volumes):
+        """Store the rollups of ``minutes`` (``volumes`` is ``(N, 4)``)."""
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO minute_volumes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(symbol, whale_threshold, minute, *row) for minute, row in zip(minutes, volumes.tolist())],
+            )
+
+    def series(self, symbol, whale_threshold, first, last, step):
+        """Summed volumes per ``step``-minute slot of ``[first, last]``: ``[(slot minute, buy, sell, wb, ws)]``."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT minute / ? * ? AS slot, SUM(buy), SUM(sell), SUM(whale_buy), SUM(whale_sell) "
+                "FROM minute_volumes WHERE symbol = ? AND whale_threshold = ? AND minute BETWEEN ? AND ? "
+                "GROUP BY slot ORDER BY slot",
+                (step, step, symbol, whale_threshold, first, last),
+            ).fetchall()
+
+
+_rollups = None
+_rollups_lock = threading.Lock()
+
+
+def get_rollups():
+    """Return the shared RollupStore."""
+    global _rollups
+    with _rollups_lock:
+        if _rollups is None:
+            _rollups = RollupStore()
+        return _rollups
+
+
+def build_rollups(symbol, whale_threshold, first, last):
+    """
+    Compute and store the rollups of the minutes in ``[first, last]`` that have none.
+
+    Minutes the trade store already holds are read from it. The others are
+    downloaded directly, FETCH_CHUNK_MINUTES at a time, without extending the
+    store: an old window must not pull every trade since then into it.
+    """
+    rollups = get_rollups()
+    store = get_store(symbol)
+    for start, end in rollups.missing(symbol, whale_threshold, first, last):
+        pieces = [(start, end)]
+        with store.lock:
+            if len(store):
+                # Minutes wholly inside the stored run (its first and last minute may be partial)
+                low, high = max(start, store.first_time // MINUTE_MS + 1), min(end, store.last_time // MINUTE_MS - 1)
+                if low <= high:
+                    save_minutes(rollups, symbol, whale_threshold, low, high,
+                                 store.window(low * MINUTE_MS, (high + 1) * MINUTE_MS - 1))
+                    pieces = [(start, low - 1), (high + 1, end)]
+        for piece_start, piece_end in pieces:
+            for chunk_start in range(piece_start, piece_end + 1, FETCH_CHUNK_MINUTES):
+                chunk_end = min(chunk_start + FETCH_CHUNK_MINUTES - 1, piece_end)
+                trades = fetch_range_parallel(symbol, chunk_start * MINUTE_MS, (chunk_end + 1) * MINUTE_MS - 1)
+                save_minutes(rollups, symbol, whale_threshold, chunk_start, chunk_end, trades)
+
+
+def save_minutes(rollups, symbol, whale_threshold, start, end, trades):
+    """Roll up ``trades`` into the minutes ``[start, end]``."""
+    minutes, _, sums = minute_buckets(trades, whale_threshold)
+    # Minutes without trades get explicit zero rows, so they aren't refetched
+    volumes = np.zeros((end - start + 1, 4))
+    volumes[minutes - start] = sums
+    rollups.save(symbol, whale_threshold, range(start, end + 1), volumes)
+
+
+def sentiment_history(symbol, start_ts, end_ts, resolution="5m", whale_threshold=100000):
+    """
+    Retail and whale sentiment per ``resolution`` slot over ``[start_ts, end_ts]``.
+    Only minutes closed for ROLLUP_SETTLE_MS are included; slots are aligned
+    to the resolution.
+    """
+    symbol = symbol.upper()
+    step = RESOLUTIONS[resolution]
+    whale_threshold = float(whale_threshold)
+    first = start_ts // MINUTE_MS // step * step
+    last = min(end_ts // MINUTE_MS, (int(time.time() * 1000) - ROLLUP_SETTLE_MS) // MINUTE_MS - 1)
+    if last < first:
+        return []
+
+    build_rollups(symbol, whale_threshold, first, last)
+    points = []
+    for slot, buy, sell, whale_buy, whale_sell in get_rollups().series(symbol, whale_threshold, first, last, step):
+        results = analyze_sentiment(buy, sell, whale_buy, whale_sell)
+        points.append({"time": slot * MINUTE_MS, **results})
+    return points
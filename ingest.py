@@ -0,0 +1,259 @@
+"""
+Live aggTrade ingestion.
+
+Subscribes to Binance's aggTrade WebSocket stream for the symbols users have
+saved signals for, and keeps each symbol's most recent trades in a fixed-size
+ring buffer so get_taker_data can answer recent windows from memory. Gaps in
+the aggregate trade ids (dropped messages, reconnects) are backfilled over
+REST before the buffer is used again.
+"""
+import asyncio
+import json
+import os
+import threading
+import numpy as np
+import websockets
+
+import tool
+from store import COLUMNS, empty_columns
+from userdb import UserStore
+
+BINANCE_WS_URL = os.getenv("BINANCE_WS_URL", "wss://stream.binance.com:9443")
+LIVE_BUFFER_TRADES = int(os.getenv("LIVE_BUFFER_TRADES", "500000"))
+
+SYMBOL_REFRESH = 60     # seconds between checks of the subscribed symbol set
+# A buffer whose last trade is older than this, relative to the end of the
+# requested window, may be missing trades (stalled stream, just reconnected)
+LIVE_MAX_LAG_MS = int(float(os.getenv("LIVE_MAX_LAG_SECONDS", "10")) * 1000)
+RECONNECT_BACKOFF = 60  # upper bound on the reconnect delay (seconds)
+
+_user_store = None
+
+
+def saved_signal_symbols():
+    """Symbols of the users' saved signals."""
+    global _user_store
+    if _user_store is None:
+        # Read-only use: the bot owns the JSON migration
+        _user_store = UserStore(legacy_json=None)
+    return _user_store.signal_symbols()
+
+
+class RingBuffer:
+    """Fixed-capacity columnar buffer of recent trades; the oldest are overwritten first."""
+
+    def __init__(self, capacity=LIVE_BUFFER_TRADES):
+        self.capacity = capacity
+        self.cols = {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self.start = 0  # index of the oldest trade
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        with self.lock:
+            self.start = self.count = 0
+
+    @property
+    def first_time(self):
+        return int(self.cols["T"][self.start]) if self.count else None
+
+    @property
+    def last_id(self):
+        return int(self.cols["a"][(self.start + self.count - 1) % self.capacity]) if self.count else None
+
+    @property
+    def last_time(self):
+        return int(self.cols["T"][(self.start + self.count - 1) % self.capacity]) if self.count else None
+
+    def append(self, cols):
+        """Append trade columns (in id order)."""
+        count = len(cols["a"])
+        if count == 0:
+            return
+        if count > self.capacity:
+            cols = {name: col[-self.capacity:] for name, col in cols.items()}
+            count = self.capacity
+        with self.lock:
+            end = (self.start + self.count) % self.capacity
+            first = min(count, self.capacity - end)
+            for name, col in cols.items():
+                self.cols[name][end:end + first] = col[:first]
+                self.cols[name][:count - first] = col[first:]
+            overflow = max(0, self.count + count - self.capacity)
+            self.count = min(self.capacity, self.count + count)
+            self.start = (self.start + overflow) % self.capacity
+
+    def append_trade(self, a, T, p, q, m):
+        """Append a single trade."""
+        with self.lock:
+            end = (self.start + self.count) % self.capacity
+            for name, value in (("a", a), ("T", T), ("p", p), ("q", q), ("m", m)):
+                self.cols[name][end] = value
+            if self.count == self.capacity:
+                self.start = (self.start + 1) % self.capacity
+            else:
+                self.count += 1
+
+    def window(self, start_ts, end_ts):
+        """Copy out the trades with ``start_ts <= T <= end_ts``."""
+        with self.lock:
+            if self.count == 0:
+                return empty_columns()
+            stop = self.start + self.count
+            # The buffer holds at most two ordered segments: [start, cap) and [0, wrap)
+            segments = [(self.start, min(stop, self.capacity))]
+            if stop > self.capacity:
+                segments.append((0, stop - self.capacity))
+
+            parts = []
+            for lo, hi in segments:
+                times = self.cols["T"][lo:hi]
+                i = lo + int(np.searchsorted(times, start_ts, side="left"))
+                j = lo + int(np.searchsorted(times, end_ts, side="right"))
+                parts.append({name: col[i:j] for name, col in self.cols.items()})
+            return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+
+class SymbolFeed:
+    """Ingestion state of one symbol."""
+
+    def __init__(self, symbol, capacity):
+        self.symbol = symbol
+        self.ring = RingBuffer(capacity)
+        self.pending = []  # trades received while a gap is being backfilled
+        self.backfilling = False
+        self.gaps = 0
+
+
+class Ingestor:
+    """Keeps the live ring buffers of the subscribed symbols up to date."""
+
+    def __init__(self, symbols=saved_signal_symbols, url=BINANCE_WS_URL, capacity=LIVE_BUFFER_TRADES):
+        self.symbols = symbols
+        self.url = url
+        self.capacity = capacity
+        self.feeds = {}
+        self.connected = False
+        self._tasks = set()
+
+    # -------- READS (any thread) -------- #
+    def volumes(self, symbol, start_ts, end_ts, whale_threshold=100000):
+        """TakerData for a window, or None if the buffer doesn't cover it."""
+        feed = self.feeds.get(symbol)
+        if feed is None or not self.connected or feed.backfilling:
+            return None
+        first_time, last_time = feed.ring.first_time, feed.ring.last_time
+        if first_time is None or first_time > start_ts or last_time < end_ts - LIVE_MAX_LAG_MS:
+            return None
+        trades = feed.ring.window(start_ts, end_ts)
+        return tool.TakerData(tool.aggregate_trades(trades, whale_threshold), histogram=tool.size_histogram(trades))
+
+    # -------- INGESTION (event loop) -------- #
+    async def run(self):
+        """Subscribe, consume and resubscribe forever."""
+        delay = 1
+        while True:
+            try:
+                # symbols() queries SQLite: keep it off the event loop
+                symbols = sorted(await asyncio.to_thread(self.symbols))
+                # Feeds of symbols no longer subscribed would go stale: drop them
+                self.feeds = {symbol: self.feeds.get(symbol) or SymbolFeed(symbol, self.capacity) for symbol in symbols}
+                if not symbols:
+                    await asyncio.sleep(SYMBOL_REFRESH)
+                    continue
+
+                streams = "/".join(f"{symbol.lower()}@aggTrade" for symbol in symbols)
+                async with websockets.connect(f"{self.url}/stream?streams={streams}", max_queue=None) as ws:
+                    self.connected = True
+                    delay = 1
+                    watcher = asyncio.ensure_future(self._watch_symbols(ws, set(symbols)))
+                    try:
+                        async for message in ws:
+                            self._on_message(message)
+                    finally:
+                        watcher.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Live ingestion stopped: {e} (retrying in {delay}s)")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_BACKOFF)
+            finally:
+                self.connected = False
+
+    async def _watch_symbols(self, ws, symbols):
+        """Close the connection when the symbol set changes, so run() resubscribes."""
+        while True:
+            await asyncio.sleep(SYMBOL_REFRESH)
+            try:
+                current = set(await asyncio.to_thread(self.symbols))
+            except Exception as e:
+                # Keep streaming the current set and try again next time
+                print(f"Live ingestion couldn't refresh its symbols: {e}")
+                continue
+            if current != symbols:
+                await ws.close()
+                return
+
+    def _on_message(self, raw):
+        data = json.loads(raw)
+        data = data.get("data", data)
+        if data.get("e") != "aggTrade":
+            return
+        feed = self.feeds.get(data["s"])
+        if feed is not None:
+            self._add(feed, (data["a"], data["T"], float(data["p"]), float(data["q"]), data["m"]))
+
+    def _add(self, feed, trade):
+        if feed.backfilling:
+            feed.pending.append(trade)
+            return
+        last_id = feed.ring.last_id
+        if last_id is not None and trade[0] <= last_id:
+            return  # duplicate, e.g. after a reconnect
+        if last_id is not None and trade[0] > last_id + 1:
+            feed.gaps += 1
+            if trade[0] - last_id - 1 > feed.ring.capacity:
+                feed.ring.clear()  # cheaper to start over than to backfill
+            else:
+                feed.backfilling = True
+                feed.pending.append(trade)
+                task = asyncio.ensure_future(self._backfill(feed, last_id + 1, trade[0] - 1))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                return
+        feed.ring.append_trade(*trade)
+
+    async def _backfill(self, feed, first_id, last_id):
+        loop = asyncio.get_running_loop()
+        try:
+            trades = await loop.run_in_executor(None, tool.fetch_id_range, feed.symbol, first_id, last_id)
+            if len(trades["a"]) != last_id - first_id + 1:
+                raise tool.FetchError(f"backfill returned {len(trades['a'])} of {last_id - first_id + 1} trades")
+            feed.ring.append(trades)
+        except Exception as e:
+            print(f"Backfill of {feed.symbol} trades {first_id}-{last_id} failed: {e}")
+            feed.ring.clear()
+        pending, feed.pending = feed.pending, []
+        feed.backfilling = False
+        for trade in pending:
+            self._add(feed, trade)
+
+    def stats(self):
+        return {
+            "connected": self.connected,
+            "symbols": {
+                symbol: {
+                    "trades": len(feed.ring),
+                    "first_time": feed.ring.first_time,
+                    "last_time": feed.ring.last_time,
+                    "last_id": feed.ring.last_id,
+                    "gaps": feed.gaps,
+                    "backfilling": feed.backfilling,
+                }
+                for symbol, feed in self.feeds.items()
+            },
+        }
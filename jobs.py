@@ -0,0 +1,220 @@
+"""
+SQLite job queue between the API and the analysis workers (worker.py).
+
+A job is one (symbol, window, whale threshold) analysis. The API submits
+jobs and waits for their results; any number of worker processes, in this
+container or others sharing the data directory, claim and run them.
+Identical jobs queued or running at the same time are merged, so a burst of
+requests for one window costs a single analysis.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+
+JOB_DB_FILE = os.getenv("JOB_DB_FILE", "data/jobs.db")
+# A claimed job whose worker hasn't finished it within this many seconds is
+# assumed lost (worker killed) and handed to another worker
+JOB_LEASE = float(os.getenv("JOB_LEASE", "600"))
+JOB_MAX_ATTEMPTS = 3
+# How long the API waits for a job's result (seconds)
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "300"))
+# Finished jobs are kept this long (seconds), then purged by the workers
+JOB_RETENTION = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id              INTEGER PRIMARY KEY,
+    symbol          TEXT NOT NULL,
+    seconds         INTEGER NOT NULL,
+    whale_threshold REAL NOT NULL,
+    status          TEXT NOT NULL DEFAULT 'queued',  -- queued, running, done, failed
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    worker          TEXT,
+    result          TEXT,  -- JSON analysis dict
+    error           TEXT,
+    progress        TEXT,  -- JSON {"done", "total", "volumes"} of the fetch in progress
+    created         REAL NOT NULL,
+    lease_until     REAL,
+    finished        REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+CREATE INDEX IF NOT EXISTS jobs_key ON jobs (symbol, seconds, whale_threshold, status);
+"""
+
+
+# Optional callback(symbol, done, total, volumes) told about the fetch
+# progress of the jobs being waited on; ``volumes`` is the running
+# ``[buy, sell, whale buy, whale sell, trades]`` over the window so far, or
+# None when the worker is only extending stored state
+job_progress = ContextVar("job_progress", default=None)
+
+
+class JobError(Exception):
+    """Raised when a job failed in the worker, or wasn't finished in time."""
+
+
+class JobQueue:
+    """Analysis jobs in SQLite (WAL mode), shared by the API and worker processes."""
+
+    def __init__(self, path=JOB_DB_FILE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.executescript(SCHEMA)
+        if "progress" not in {row["name"] for row in self.conn.execute("PRAGMA table_info(jobs)")}:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN progress TEXT")  # queue created before progress
+
+    # -------- API SIDE -------- #
+    def submit(self, symbol, seconds, whale_threshold):
+        """Queue an analysis, or join the identical one already queued or running; returns the job id."""
+        key = (symbol.upper(), int(seconds), float(whale_threshold))
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            row = self.conn.execute(
+                "SELECT id FROM jobs WHERE symbol = ? AND seconds = ? AND whale_threshold = ? "
+                "AND status IN ('queued', 'running') ORDER BY id DESC LIMIT 1",
+                key,
+            ).fetchone()
+            if row is not None:
+                return row["id"]
+            return self.conn.execute(
+                "INSERT INTO jobs (symbol, seconds, whale_threshold, created) VALUES (?, ?, ?, ?)",
+                (*key, time.time()),
+            ).lastrowid
+
+    def finished(self, ids):
+        """``{id: result dict or JobError}`` for those of ``ids`` that are done or failed."""
+        if not ids:
+            return {}
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT id, status, result, error FROM jobs WHERE id IN ({','.join('?' * len(ids))}) "
+                "AND status IN ('done', 'failed')",
+                list(ids),
+            ).fetchall()
+        return {
+            row["id"]: json.loads(row["result"]) if row["status"] == "done" else JobError(row["error"])
+            for row in rows
+        }
+
+    def progress(self, ids):
+        """``{id: progress dict}`` for those of ``ids`` that reported fetch progress."""
+        if not ids:
+            return {}
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT id, progress FROM jobs WHERE id IN ({','.join('?' * len(ids))}) AND progress IS NOT NULL",
+                list(ids),
+            ).fetchall()
+        return {row["id"]: json.loads(row["progress"]) for row in rows}
+
+    def wait(self, ids, timeout, abort=None, on_progress=None):
+        """
+        Poll until every job in ``ids`` has finished; returns ``{id: result
+        dict or JobError}``. Jobs still running after ``timeout`` seconds, or
+        once the optional ``abort`` signal is set, map to a JobError. The
+        optional ``on_progress(id, progress dict)`` is called whenever a
+        pending job reports new fetch progress.
+        """
+        pending, results, seen = set(ids), {}, {}
+        deadline = time.monotonic() + timeout
+        delay = 0.01
+        while pending:
+            done = self.finished(pending)
+            results.update(done)
+            pending -= done.keys()
+            if not pending:
+                break
+            if on_progress is not None:
+                for job_id, progress in self.progress(pending).items():
+                    if seen.get(job_id) != progress:
+                        seen[job_id] = progress
+                        on_progress(job_id, progress)
+            if time.monotonic() >= deadline or (abort is not None and abort.is_set()):
+                results.update({job_id: JobError(f"job {job_id} not finished after {timeout:g}s")
+                                for job_id in pending})
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+        return results
+
+    # -------- WORKER SIDE -------- #
+    def claim(self, worker):
+        """Take the oldest queued job (or one whose lease expired); returns its row or None."""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            # Jobs abandoned by a dead worker go back to the queue, up to JOB_MAX_ATTEMPTS
+            self.conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                "error = CASE WHEN attempts >= ? THEN 'worker lost' ELSE error END, "
+                "finished = CASE WHEN attempts >= ? THEN ? ELSE finished END "
+                "WHERE status = 'running' AND lease_until < ?",
+                (JOB_MAX_ATTEMPTS, JOB_MAX_ATTEMPTS, JOB_MAX_ATTEMPTS, now, now),
+            )
+            row = self.conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, lease_until = ?, "
+                "progress = NULL WHERE id = ?",
+                (worker, now + JOB_LEASE, row["id"]),
+            )
+            return row
+
+    def report(self, job_id, done, total, volumes=None):
+        """Record a running job's fetch progress (see job_progress)."""
+        with self.lock:
+            self.conn.execute("UPDATE jobs SET progress = ? WHERE id = ?",
+                              (json.dumps({"done": done, "total": total, "volumes": volumes}), job_id))
+
+    def complete(self, job_id, result=None, error=None):
+        """Record a job's result dict, or its error message."""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ? WHERE id = ?",
+                ("failed" if error is not None else "done", None if error is not None else json.dumps(result),
+                 error, time.time(), job_id),
+            )
+
+    def purge(self, older_than=JOB_RETENTION):
+        """Delete jobs finished more than ``older_than`` seconds ago."""
+        with self.lock:
+            self.conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?",
+                              (time.time() - older_than,))
+
+    def stats(self):
+        """Job counts by status, and the age of the oldest queued job (seconds)."""
+        with self.lock:
+            counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = self.conn.execute("SELECT MIN(created) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        return {
+            "counts": {status: counts.get(status, 0) for status in ("queued", "running", "done", "failed")},
+            "oldest_queued_age": time.time() - oldest if oldest else 0.0,
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return this process's JobQueue connection."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
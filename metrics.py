@@ -0,0 +1,158 @@
+"""
+In-process metrics rendered in the Prometheus text format, plus an optional
+per-request timing breakdown.
+
+    PAGES = Counter("binance_pages_total", "aggTrades pages fetched")
+    PAGES.inc()
+    with stage("fetch"):
+        ...
+    render()  # body for GET /metrics
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Default latency buckets (seconds)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry = []
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), callback=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.callback = callback  # () -> {label values tuple: value}, read at scrape time
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _label_text(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+    def samples(self):
+        if self.callback:
+            values = self.callback()
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [f"{self.name}{self._label_text(key)} {value:g}" for key, value in sorted(values.items())]
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # Per label set: [cumulative count per bucket..., +Inf count, sum]
+            state = self._values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        lines = []
+        for key, state in sorted(values.items()):
+            bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, state):
+                lines.append(f"{self.name}_bucket{self._label_text(key, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {state[-1]:g}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {state[-2]}")
+        return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# -------- PER-REQUEST TIMINGS -------- #
+class Timings:
+    """Seconds per pipeline stage and counters for one request; shared across its threads."""
+
+    def __init__(self):
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, amount):
+        with self._lock:
+            self.values[name] = self.values.get(name, 0) + amount
+
+    def as_dict(self):
+        with self._lock:
+            return {name: round(value, 6) if isinstance(value, float) else value for name, value in self.values.items()}
+
+
+# The current request's Timings, if it asked for a breakdown
+request_timings = ContextVar("request_timings", default=None)
+
+STAGE_SECONDS = Histogram("pipeline_stage_seconds", "Wall time of each analysis pipeline stage", ["stage"])
+
+
+def record(name, amount):
+    """Add to the current request's breakdown, if any."""
+    timings = request_timings.get()
+    if timings is not None:
+        timings.add(name, amount)
+
+
+@contextmanager
+def stage(name):
+    """Time a block as pipeline stage ``name`` (histogram + request breakdown)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        record(f"{name}_seconds", elapsed)
@@ -0,0 +1,236 @@
+import os
+import shutil
+import threading
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: the store is only shared between threads
+    fcntl = None
+
+# Root directory for the on-disk aggTrade store (one sub-directory per symbol)
+TRADE_STORE_DIR = os.getenv("TRADE_STORE_DIR", "data/trades")
+
+# Column name -> dtype, using Binance's aggTrade field names
+COLUMNS = {
+    "a": np.int64,    # aggregate trade id
+    "T": np.int64,    # trade time (ms)
+    "p": np.float64,  # price
+    "q": np.float64,  # quantity
+    "m": np.bool_,    # buyer is maker → taker SELL
+}
+
+
+def empty_columns():
+    """Return an empty set of trade columns."""
+    return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+
+def concat_columns(parts):
+    """Concatenate several column dicts, in order."""
+    parts = [part for part in parts if len(part["a"])]
+    if not parts:
+        return empty_columns()
+    return {
+        name: np.concatenate([part[name] for part in parts]).astype(dtype, copy=False)
+        for name, dtype in COLUMNS.items()
+    }
+
+
+def slice_columns(cols, start, stop):
+    """Slice every column of a column dict."""
+    return {name: col[start:stop] for name, col in cols.items()}
+
+
+class StoreLock:
+    """
+    Re-entrant lock over one symbol's store, shared by this process's threads
+    and, through ``flock`` on a LOCK file, by every process using the same
+    TRADE_STORE_DIR (e.g. analysis workers). Taking it reloads the store's
+    view of the files, which another process may have extended or rewritten.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = os.open(os.path.join(store.path, "LOCK"), os.O_RDWR | os.O_CREAT, 0o644) if fcntl else None
+
+    def __enter__(self):
+        self._lock.acquire()
+        self._depth += 1
+        if self._depth == 1 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            self._store._reload()
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._lock.release()
+
+
+class TradeStore:
+    """
+    Append-only, columnar aggTrade store for a single symbol.
+
+    Every column is a flat binary file holding one contiguous run of aggregate
+    trade ids, ordered by ``a``. New trades are appended to the end of the
+    files; reads are memory-mapped. A run lives in a numbered generation
+    directory and ``CURRENT`` names the live one, so the rare rewrites
+    (extending the run backwards, trimming old trades, or starting a new run)
+    are swapped in atomically. Reads and writes go through ``lock`` (see StoreLock).
+    """
+
+    def __init__(self, symbol, root=TRADE_STORE_DIR):
+        self.symbol = symbol.upper()
+        self.path = os.path.join(root, self.symbol)
+        os.makedirs(self.path, exist_ok=True)
+        self.lock = StoreLock(self)
+        with self.lock:
+            self._reload()
+
+    # -------- FILE LAYOUT -------- #
+    def _read_current(self):
+        current = os.path.join(self.path, "CURRENT")
+        if os.path.exists(current):
+            with open(current) as f:
+                return int(f.read().strip() or 0)
+        return 0
+
+    def _reload(self):
+        """Re-read the live generation and run length from disk."""
+        self._generation = self._read_current()
+        self._length = self._repair()
+
+    def _file(self, name, generation=None):
+        generation = self._generation if generation is None else generation
+        return os.path.join(self.path, str(generation), f"{name}.bin")
+
+    def _repair(self):
+        """Truncate columns to a common length after an interrupted append."""
+        os.makedirs(os.path.join(self.path, str(self._generation)), exist_ok=True)
+        lengths = {}
+        for name, dtype in COLUMNS.items():
+            path = self._file(name)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            lengths[name] = size // np.dtype(dtype).itemsize
+        length = min(lengths.values())
+        for name, dtype in COLUMNS.items():
+            path = self._file(name)
+            if lengths[name] != length or not os.path.exists(path):
+                with open(path, "ab") as f:
+                    f.truncate(length * np.dtype(dtype).itemsize)
+        return length
+
+    # -------- READS -------- #
+    def __len__(self):
+        return self._length
+
+    def column(self, name):
+        """Memory-map one column of the current run."""
+        if self._length == 0:
+            return np.empty(0, dtype=COLUMNS[name])
+        return np.memmap(self._file(name), dtype=COLUMNS[name], mode="r", shape=(self._length,))
+
+    def columns(self):
+        return {name: self.column(name) for name in COLUMNS}
+
+    @property
+    def first_id(self):
+        return int(self.column("a")[0]) if self._length else None
+
+    @property
+    def last_id(self):
+        return int(self.column("a")[-1]) if self._length else None
+
+    @property
+    def first_time(self):
+        return int(self.column("T")[0]) if self._length else None
+
+    @property
+    def last_time(self):
+        return int(self.column("T")[-1]) if self._length else None
+
+    def window(self, start_ts, end_ts):
+        """Return the trades with ``start_ts <= T <= end_ts`` (ms)."""
+        times = self.column("T")
+        start = int(np.searchsorted(times, start_ts, side="left"))
+        stop = int(np.searchsorted(times, end_ts, side="right"))
+        return slice_columns(self.columns(), start, stop)
+
+    def since(self, trade_id):
+        """Return the trades with ``a > trade_id``."""
+        if self._length == 0:
+            return empty_columns()
+        start = min(max(trade_id + 1 - self.first_id, 0), self._length)
+        return slice_columns(self.columns(), start, self._length)
+
+    # -------- WRITES -------- #
+    def append(self, cols):
+        """Append trades that continue the run; already-stored ids are ignored."""
+        if self._length:
+            cols = slice_columns(cols, int(np.searchsorted(cols["a"], self.last_id, side="right")), None)
+        count = len(cols["a"])
+        if count == 0:
+            return 0
+        if self._length and cols["a"][0] != self.last_id + 1:
+            raise ValueError(
+                f"{self.symbol}: trade {cols['a'][0]} does not continue stored run ending at {self.last_id}"
+            )
+        for name, dtype in COLUMNS.items():
+            with open(self._file(name), "ab") as f:
+                f.write(np.ascontiguousarray(cols[name], dtype=dtype).tobytes())
+        self._length += count
+        return count
+
+    def prepend(self, cols):
+        """Extend the run backwards. This rewrites the run once."""
+        cols = slice_columns(cols, 0, int(np.searchsorted(cols["a"], self.first_id, side="left")))
+        if len(cols["a"]) == 0:
+            return 0
+        if cols["a"][-1] != self.first_id - 1:
+            raise ValueError(
+                f"{self.symbol}: trade {cols['a'][-1]} does not precede stored run starting at {self.first_id}"
+            )
+        self._rewrite(concat_columns([cols, self.columns()]))
+        return len(cols["a"])
+
+    def trim(self, before_ts):
+        """Drop the trades with ``T < before_ts``. This rewrites the run once."""
+        start = int(np.searchsorted(self.column("T"), before_ts, side="left"))
+        if start == 0:
+            return 0
+        self._rewrite(slice_columns(self.columns(), start, self._length))
+        return start
+
+    def reset(self, cols=None):
+        """Replace the stored run with ``cols`` (or nothing)."""
+        self._rewrite(cols if cols is not None else empty_columns())
+
+    def _rewrite(self, cols):
+        old, new = self._generation, self._generation + 1
+        os.makedirs(os.path.join(self.path, str(new)), exist_ok=True)
+        for name, dtype in COLUMNS.items():
+            with open(self._file(name, new), "wb") as f:
+                f.write(np.ascontiguousarray(cols[name], dtype=dtype).tobytes())
+        tmp = os.path.join(self.path, "CURRENT.tmp")
+        with open(tmp, "w") as f:
+            f.write(str(new))
+        os.replace(tmp, os.path.join(self.path, "CURRENT"))
+        self._generation, self._length = new, len(cols["a"])
+        shutil.rmtree(os.path.join(self.path, str(old)), ignore_errors=True)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(symbol):
+    """Return the shared TradeStore for ``symbol``."""
+    symbol = symbol.upper()
+    with _stores_lock:
+        if symbol not in _stores:
+            _stores[symbol] = TradeStore(symbol)
+        return _stores[symbol]
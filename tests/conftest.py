@@ -0,0 +1,65 @@
+"""
+Shared fixtures: every test runs offline against fake_binance, with the data
+files (trade store, rollups, users, jobs) in a temporary directory.
+"""
+import os
+import shutil
+import tempfile
+import time
+
+# Before the modules under test read their configuration
+DATA_DIR = tempfile.mkdtemp(prefix="market-bot-tests-")
+os.environ.update(
+    TRADE_STORE_DIR=os.path.join(DATA_DIR, "trades"),
+    ROLLUP_DB_FILE=os.path.join(DATA_DIR, "rollups.db"),
+    USER_DB_FILE=os.path.join(DATA_DIR, "users.db"),
+    JOB_DB_FILE=os.path.join(DATA_DIR, "jobs.db"),
+    LIVE_INGEST="0",
+)
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+import numpy as np
+import pytest
+
+import store
+import tool
+from fake_binance import FakeBinance, synthetic_tape
+
+SYMBOL = "BTCUSDT"
+TAPE_TRADES = 60_000
+TAPE_RATE = 2  # trades per second: the tape spans about 8h
+
+
+@pytest.fixture(scope="session")
+def tape():
+    """A synthetic BTCUSDT tape whose last trade is at session start."""
+    now_ms = int(time.time() * 1000)
+    tape = synthetic_tape(TAPE_TRADES, start_ts=now_ms, trades_per_sec=TAPE_RATE)
+    tape["T"] -= tape["T"][-1] - now_ms
+    return tape
+
+
+@pytest.fixture
+def binance(tape, monkeypatch):
+    """FakeBinance serving the tape, with the Binance client pointed at it."""
+    server = FakeBinance({SYMBOL: tape}).start()
+    tool.get_client().API_URL = server.api_url
+    monkeypatch.setattr(tool, "BACKOFF_BASE", 0.001)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def trade_store():
+    """An empty BTCUSDT trade store, and no rolling state."""
+    shutil.rmtree(os.path.join(store.TRADE_STORE_DIR, SYMBOL), ignore_errors=True)
+    store._stores.pop(SYMBOL, None)
+    tool._rolling_states.clear()
+    return store.get_store(SYMBOL)
+
+
+def tape_window(tape, start_ts, end_ts):
+    """The tape's trades with ``start_ts <= T <= end_ts``."""
+    start = int(np.searchsorted(tape["T"], start_ts, side="left"))
+    stop = int(np.searchsorted(tape["T"], end_ts, side="right"))
+    return store.slice_columns(tape, start, stop)
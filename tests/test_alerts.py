@@ -0,0 +1,74 @@
+import pytest
+
+import alerts
+from alerts import evaluate, parse_rule
+
+ROW = {"whale_sentiment_index": 0.0, "sentiment_index": 0.0, "divergence": 0.0}
+
+
+def row(whale=0.0, retail=0.0):
+    return {**ROW, "whale_sentiment_index": whale, "sentiment_index": retail, "divergence": whale - retail}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("whale > 0.3", ("whale", ">", 0.3, False)),
+    ("Retail below -0.2", ("retail", "<", -0.2, False)),
+    ("divergence crosses above 0.5 narrative", ("divergence", ">", 0.5, True)),
+    ("whale index < .25", ("whale", "<", 0.25, False)),
+    ("divergence > 1.5", ("divergence", ">", 1.5, False)),
+])
+def test_parse_rule(text, expected):
+    rule = parse_rule(text)
+    assert (rule["metric"], rule["op"], rule["threshold"], rule["narrative"]) == expected
+
+
+@pytest.mark.parametrize("text", ["whale > 1.2", "retail >= 0.3", "volume > 0.1", "whale above", ""])
+def test_parse_rule_rejects(text):
+    assert parse_rule(text) is None
+
+
+def new_rule(text):
+    return {**parse_rule(text), "armed": True, "last_fired": None}
+
+
+def test_fires_once_until_rearmed(monkeypatch):
+    monkeypatch.setattr(alerts, "ALERT_COOLDOWN", 0)
+    monkeypatch.setattr(alerts, "ALERT_HYSTERESIS", 0.05)
+    rule = new_rule("whale > 0.3")
+    assert not evaluate(rule, row(whale=0.2), now=0)
+    assert evaluate(rule, row(whale=0.4), now=1)
+    assert not evaluate(rule, row(whale=0.5), now=2)
+    # Back under the threshold, but not by the hysteresis margin: still disarmed
+    assert not evaluate(rule, row(whale=0.28), now=3)
+    assert not evaluate(rule, row(whale=0.4), now=4)
+    assert not evaluate(rule, row(whale=0.2), now=5)
+    assert rule["armed"]
+    assert evaluate(rule, row(whale=0.35), now=6)
+
+
+def test_a_new_rule_only_fires_on_a_later_crossing(monkeypatch):
+    monkeypatch.setattr(alerts, "ALERT_COOLDOWN", 0)
+    assert alerts.initial_armed(parse_rule("whale > 0.3"), row(whale=0.1))
+    # Already above the threshold, or not known yet: it has to clear first
+    for current in (row(whale=0.5), None):
+        rule = parse_rule("whale > 0.3")
+        rule.update(armed=alerts.initial_armed(rule, current), last_fired=None)
+        assert not evaluate(rule, row(whale=0.5), now=1)
+        assert not evaluate(rule, row(whale=0.1), now=2)
+        assert evaluate(rule, row(whale=0.4), now=3)
+
+
+def test_cooldown_holds_back_a_rearmed_rule(monkeypatch):
+    monkeypatch.setattr(alerts, "ALERT_COOLDOWN", 100)
+    rule = new_rule("divergence below -0.4")
+    assert evaluate(rule, row(whale=-0.3, retail=0.2), now=1000)
+    assert not evaluate(rule, row(), now=1010)
+    assert not evaluate(rule, row(whale=-0.5), now=1020)
+    assert evaluate(rule, row(whale=-0.5), now=1100)
+    assert rule["last_fired"] == 1100
+
+
+def test_describe_and_format():
+    rule = {**new_rule("retail < -0.2 narrative"), "symbol": "BTCUSDT", "timeframe": "1h"}
+    assert alerts.describe_rule(rule) == "retail index below -0.20 (+ narrative)"
+    assert alerts.format_alert(rule, row(retail=-0.3)).startswith("🚨 BTCUSDT 1h: retail index below -0.20")
@@ -0,0 +1,93 @@
+import asyncio
+import collections
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import agent
+import api
+from conftest import SYMBOL
+
+
+@pytest.fixture
+def client(binance, trade_store):
+    agent.analysis_cache.clear()
+    api.response_cache.clear()
+    with TestClient(api.app) as client:
+        yield client
+
+
+def stream_events(client, query):
+    lines = client.post("/analyze/stream", json={"query": query}).iter_lines()
+    return [json.loads(line) for line in lines if line]
+
+
+def test_structured_query_is_answered_without_the_agent(client):
+    response = client.post("/analyze", json={"query": f"{SYMBOL} 1h"}).json()
+    assert response["result"].startswith(f"📊 {SYMBOL} · last 1h")
+
+
+def test_analysis_errors_get_a_readable_reply(client, monkeypatch):
+    def fail(query):
+        raise ValueError("bad volumes")
+
+    monkeypatch.setattr(api, "quick_report", fail)
+    response = client.post("/analyze", json={"query": f"{SYMBOL} 2h"})
+    assert response.status_code == 200
+    assert response.json()["result"] == f"⚠️ Couldn't analyze {SYMBOL}: bad volumes"
+
+
+def test_stream_sends_partials_only_for_a_cold_fetch(client):
+    cold = stream_events(client, f"{SYMBOL} 1h")
+    kinds = collections.Counter(event["event"] for event in cold)
+    assert kinds["progress"] and kinds["partial"] == kinds["progress"] and kinds["result"] == 1
+
+    agent.analysis_cache.clear()
+    api.response_cache.clear()
+    time.sleep(1)
+    warm = stream_events(client, f"{SYMBOL} 1h")
+    assert not any(event["event"] == "partial" for event in warm)
+    assert warm[-1]["event"] == "result"
+
+
+@pytest.mark.parametrize("top", [0, -3])
+def test_batch_rejects_a_non_positive_top(client, top):
+    assert client.post("/analyze/batch", json={"symbols": [SYMBOL], "top": top}).status_code == 422
+
+
+def test_batch_ranks_and_reports_bad_symbols(client):
+    response = client.post("/analyze/batch", json={"symbols": [SYMBOL, "NOPEUSDT"], "window": "30m"}).json()
+    assert [row["symbol"] for row in response["rows"]] == [SYMBOL]
+    assert "NOPEUSDT" in response["errors"]
+
+
+def test_history_rejects_an_old_end(client):
+    end = int(time.time() * 1000) - int((api.HISTORY_MAX_AGE_DAYS + 1) * 86400 * 1000)
+    response = client.get("/sentiment/history", params={"symbol": SYMBOL, "window": "1h", "end": end})
+    assert response.status_code == 400
+
+
+def test_agent_is_built_off_the_event_loop(monkeypatch):
+    class Agent:
+        async def ainvoke(self, state, config=None):
+            return {"messages": [SimpleNamespace(content="ok")]}
+
+    def build():
+        time.sleep(0.3)
+        return Agent()
+
+    monkeypatch.setattr(api, "get_agent", build)
+
+    async def run():
+        task = asyncio.ensure_future(api.run_agent("hi"))
+        longest, last = 0, time.monotonic()
+        while not task.done():
+            await asyncio.sleep(0.01)
+            longest, last = max(longest, time.monotonic() - last), time.monotonic()
+        return task.result(), longest
+
+    result, longest = asyncio.run(run())
+    assert result == "ok" and longest < 0.2
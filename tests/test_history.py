@@ -0,0 +1,82 @@
+import time
+
+import numpy as np
+import pytest
+
+import history
+import tool
+from conftest import SYMBOL, tape_window
+
+MINUTE = 60 * 1000
+HOUR = 60 * MINUTE
+
+
+@pytest.fixture
+def rollups(tmp_path, monkeypatch):
+    rollups = history.RollupStore(str(tmp_path / "rollups.db"))
+    monkeypatch.setattr(history, "_rollups", rollups)
+    return rollups
+
+
+def expected_points(tape, first, last, step):
+    """Per-slot sums straight from the tape."""
+    points = []
+    for slot in range(first, last + 1, step):
+        trades = tape_window(tape, slot * MINUTE, min(slot + step, last + 1) * MINUTE - 1)
+        points.append(tool.aggregate_trades(trades))
+    return points
+
+
+def closed_end(tape):
+    """An end time before the tape's last (possibly still open) minute."""
+    return (int(tape["T"][-1]) // MINUTE - 1) * MINUTE - 1
+
+
+def test_history_matches_the_tape(binance, tape, trade_store, rollups):
+    end_ts = closed_end(tape)
+    points = history.sentiment_history(SYMBOL, end_ts - 2 * HOUR, end_ts, "5m")
+    first = (end_ts - 2 * HOUR) // MINUTE // 5 * 5
+    last = end_ts // MINUTE
+    expected = expected_points(tape, first, last, 5)
+    assert len(points) == len(expected)
+    for point, volumes in zip(points, expected):
+        assert np.allclose([point["buy_volume"], point["sell_volume"],
+                            point["whale_buy_volume"], point["whale_sell_volume"]], volumes)
+
+
+def test_history_reuses_stored_rollups(binance, tape, trade_store, rollups):
+    end_ts = closed_end(tape)
+    start_ts = (end_ts - 2 * HOUR) // HOUR * HOUR
+    history.sentiment_history(SYMBOL, start_ts, end_ts, "1m")
+    requests = binance.requests
+    coarse = history.sentiment_history(SYMBOL, start_ts, end_ts, "1h")
+    assert binance.requests == requests
+    assert len(coarse) == 3
+
+
+def test_old_window_does_not_extend_the_trade_store(binance, tape, trade_store, rollups):
+    end_ts = int(tape["T"][-1])
+    tool.sync_store(trade_store, end_ts - 10 * MINUTE, end_ts)
+    stored = len(trade_store), trade_store.first_id
+
+    requests = binance.requests
+    points = history.sentiment_history(SYMBOL, end_ts - 7 * HOUR, end_ts - 6 * HOUR, "5m")
+    assert points
+    assert (len(trade_store), trade_store.first_id) == stored
+    # Only the old hour is downloaded, not everything since then
+    assert binance.requests - requests < 20
+
+
+def test_stored_minutes_are_read_from_the_store(binance, tape, trade_store, rollups):
+    end_ts = int(tape["T"][-1])
+    tool.sync_store(trade_store, end_ts - 2 * HOUR, end_ts)
+    requests = binance.requests
+    history.sentiment_history(SYMBOL, end_ts - HOUR, closed_end(tape), "5m")
+    assert binance.requests == requests
+
+
+def test_recent_minutes_are_left_to_settle(binance, tape, trade_store, rollups, monkeypatch):
+    monkeypatch.setattr(history, "ROLLUP_SETTLE_MS", HOUR)
+    end_ts = int(tape["T"][-1])
+    points = history.sentiment_history(SYMBOL, end_ts - 3 * HOUR, end_ts, "1m")
+    assert points and points[-1]["time"] + MINUTE <= int(time.time() * 1000) - HOUR
@@ -0,0 +1,128 @@
+import asyncio
+import sqlite3
+import time
+
+import numpy as np
+
+import ingest
+import tool
+from fake_binance import ReplayStream, synthetic_tape
+from ingest import Ingestor, RingBuffer
+from store import slice_columns
+
+MINUTE = 60 * 1000
+
+
+def recent_tape(count, seed=0):
+    now_ms = int(time.time() * 1000)
+    tape = synthetic_tape(count, start_ts=now_ms, trades_per_sec=50, seed=seed)
+    tape["T"] -= tape["T"][-1] - now_ms
+    return tape
+
+
+def test_ring_buffer_wraps_in_order():
+    tape = synthetic_tape(250)
+    ring = RingBuffer(capacity=100)
+    ring.append(slice_columns(tape, 0, 150))
+    for i in range(150, 250):
+        ring.append_trade(*(tape[name][i] for name in ("a", "T", "p", "q", "m")))
+    window = ring.window(0, int(tape["T"][-1]))
+    assert np.array_equal(window["a"], tape["a"][150:])
+    assert ring.last_time == int(tape["T"][-1])
+
+
+def ingest_until(ingestor, stream, done, after=None):
+    """Run the ingestor until ``done()``, then optionally ``after()``, inside one event loop."""
+    async def run():
+        task = asyncio.ensure_future(ingestor.run())
+        try:
+            deadline = time.monotonic() + 20
+            while not done():
+                assert time.monotonic() < deadline, "ingestion did not catch up"
+                await asyncio.sleep(0.02)
+            if after is not None:
+                await after()
+        finally:
+            task.cancel()
+    asyncio.run(run())
+
+
+def test_dropped_trades_are_backfilled(binance, tape):
+    # The REST fake serves the same tape the stream replays, minus a few ids
+    drop = np.random.default_rng(1).choice(tape["a"][-20_000:-1], 30, replace=False).tolist()
+    recent = slice_columns(tape, len(tape["a"]) - 20_000, len(tape["a"]))
+    stream = ReplayStream({"BTCUSDT": recent}, rate=100_000, drop=drop).start()
+    ingestor = Ingestor(symbols=lambda: {"BTCUSDT"}, url=stream.url, capacity=50_000)
+    last_id = int(tape["a"][-1])
+    try:
+        ingest_until(ingestor, stream, lambda: stream.finished.is_set() and "BTCUSDT" in ingestor.feeds
+                     and ingestor.feeds["BTCUSDT"].ring.last_id == last_id
+                     and not ingestor.feeds["BTCUSDT"].backfilling)
+    finally:
+        stream.stop()
+    feed = ingestor.feeds["BTCUSDT"]
+    assert feed.gaps == 30
+    assert np.array_equal(feed.ring.window(0, int(tape["T"][-1]))["a"], recent["a"])
+
+    ingestor.connected = True
+    end_ts = int(tape["T"][-1])
+    data = ingestor.volumes("BTCUSDT", end_ts - 2 * MINUTE, end_ts)
+    expected = recent["T"] >= end_ts - 2 * MINUTE
+    assert np.allclose(data, tool.aggregate_trades(slice_columns(recent, int(np.argmax(expected)), None)))
+
+
+def test_stale_and_unsubscribed_feeds_are_not_served(monkeypatch):
+    monkeypatch.setattr(ingest, "SYMBOL_REFRESH", 0.1)
+    tapes = {"BTCUSDT": recent_tape(2000), "ETHUSDT": recent_tape(2000, seed=1)}
+    stream = ReplayStream(tapes, rate=100_000).start()
+    symbols = {"BTCUSDT", "ETHUSDT"}
+    ingestor = Ingestor(symbols=lambda: set(symbols), url=stream.url, capacity=10_000)
+    end_ts = int(tapes["ETHUSDT"]["T"][-1])
+    seen = {}
+
+    async def check():
+        seen["live"] = ingestor.volumes("ETHUSDT", end_ts - 10_000, end_ts)
+        # The buffer stops well before the end of this window
+        seen["stale"] = ingestor.volumes("ETHUSDT", end_ts, end_ts + 5 * MINUTE)
+        symbols.discard("ETHUSDT")
+        while "ETHUSDT" in ingestor.feeds:
+            await asyncio.sleep(0.05)
+        seen["dropped"] = ingestor.volumes("ETHUSDT", end_ts - 10_000, end_ts)
+
+    try:
+        ingest_until(ingestor, stream, lambda: "ETHUSDT" in ingestor.feeds
+                     and ingestor.feeds["ETHUSDT"].ring.last_id == int(tapes["ETHUSDT"]["a"][-1]), check)
+    finally:
+        stream.stop()
+    assert seen["live"] is not None
+    assert seen["stale"] is None
+    assert seen["dropped"] is None
+
+
+def test_symbol_lookup_errors_are_retried(monkeypatch):
+    monkeypatch.setattr(ingest, "SYMBOL_REFRESH", 0.1)
+    tapes = {"BTCUSDT": recent_tape(2000), "ETHUSDT": recent_tape(2000, seed=1)}
+    stream = ReplayStream(tapes, rate=100_000).start()
+    symbols = {"BTCUSDT", "ETHUSDT"}
+    calls = []
+
+    def lookup():
+        # The first lookup of run() and of the symbol watcher both fail
+        calls.append(len(calls))
+        if len(calls) in (1, 3):
+            raise sqlite3.OperationalError("database is locked")
+        return set(symbols)
+
+    ingestor = Ingestor(symbols=lookup, url=stream.url, capacity=10_000)
+
+    async def unsubscribe():
+        # The watcher still notices a change after its failed lookup
+        symbols.discard("ETHUSDT")
+        while "ETHUSDT" in ingestor.feeds:
+            await asyncio.sleep(0.05)
+
+    try:
+        ingest_until(ingestor, stream, lambda: len(calls) > 3 and "ETHUSDT" in ingestor.feeds, unsubscribe)
+    finally:
+        stream.stop()
+    assert list(ingestor.feeds) == ["BTCUSDT"]
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+import jobs
+from jobs import JobError, JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    yield queue
+    queue.close()
+
+
+def test_identical_jobs_are_merged(queue):
+    job_id = queue.submit("btcusdt", 3600, 100000)
+    assert queue.submit("BTCUSDT", 3600, 100000.0) == job_id
+    assert queue.submit("BTCUSDT", 7200, 100000) != job_id
+    # Once running it is still joined; once finished a new job is queued
+    queue.claim("w")
+    assert queue.submit("BTCUSDT", 3600, 100000) == job_id
+    queue.complete(job_id, {"sentiment_index": 0.1})
+    assert queue.submit("BTCUSDT", 3600, 100000) != job_id
+
+
+def test_claim_takes_the_oldest_job(queue):
+    first = queue.submit("BTCUSDT", 3600, 100000)
+    second = queue.submit("ETHUSDT", 3600, 100000)
+    assert queue.claim("w")["id"] == first
+    assert queue.claim("w")["id"] == second
+    assert queue.claim("w") is None
+
+
+def test_lost_jobs_are_retried_then_failed(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_LEASE", -1)  # every lease has expired by the next claim
+    job_id = queue.submit("BTCUSDT", 3600, 100000)
+    for attempt in range(1, jobs.JOB_MAX_ATTEMPTS + 1):
+        job = queue.claim(f"w{attempt}")
+        assert (job["id"], job["attempts"]) == (job_id, attempt - 1)
+    assert queue.claim("w") is None
+    result = queue.finished([job_id])[job_id]
+    assert isinstance(result, JobError) and "worker lost" in str(result)
+
+
+def test_wait_returns_results_and_errors(queue):
+    ok, bad = queue.submit("BTCUSDT", 3600, 100000), queue.submit("NOPEUSDT", 3600, 100000)
+
+    def work():
+        time.sleep(0.05)
+        queue.complete(ok, {"sentiment_index": 0.5})
+        queue.complete(bad, error="Binance rejected NOPEUSDT")
+
+    threading.Thread(target=work).start()
+    results = queue.wait([ok, bad], timeout=5)
+    assert results[ok] == {"sentiment_index": 0.5}
+    assert isinstance(results[bad], JobError) and "NOPEUSDT" in str(results[bad])
+
+
+def test_wait_times_out_and_aborts(queue):
+    job_id = queue.submit("BTCUSDT", 3600, 100000)
+    assert isinstance(queue.wait([job_id], timeout=0.05)[job_id], JobError)
+    abort = threading.Event()
+    abort.set()
+    assert isinstance(queue.wait([job_id], timeout=5, abort=abort)[job_id], JobError)
+
+
+def test_wait_relays_progress(queue):
+    job_id = queue.submit("BTCUSDT", 3600, 100000)
+    seen = []
+
+    def work():
+        queue.report(job_id, 1, 2, [1.0, 2.0, 0.0, 0.0, 10])
+        time.sleep(0.1)
+        queue.report(job_id, 2, 2, [3.0, 2.0, 0.0, 0.0, 20])
+        time.sleep(0.1)
+        queue.complete(job_id, {})
+
+    threading.Thread(target=work).start()
+    queue.wait([job_id], timeout=5, on_progress=lambda job, progress: seen.append(progress["done"]))
+    assert seen == [1, 2]
+
+
+def test_purge_and_stats(queue):
+    done = queue.submit("BTCUSDT", 3600, 100000)
+    queue.submit("ETHUSDT", 3600, 100000)
+    queue.claim("w")
+    queue.complete(done, {})
+    assert queue.stats()["counts"] == {"queued": 1, "running": 0, "done": 1, "failed": 0}
+    queue.purge(older_than=-1)
+    assert queue.stats()["counts"]["done"] == 0
@@ -0,0 +1,35 @@
+import pytest
+
+from agent import DEFAULT_WHALE_THRESHOLD, ParsedQuery, parse_query, parse_window
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("ADAUSDT 3h", ParsedQuery("ADAUSDT", 3 * 3600)),
+    ("btcusdt 1 day", ParsedQuery("BTCUSDT", 86400)),
+    ("ETHUSDT 30 minutes", ParsedQuery("ETHUSDT", 1800)),
+    ("ETHUSDT 4h whale threshold 50k", ParsedQuery("ETHUSDT", 4 * 3600, 50000)),
+    ("SOLUSDT 2w whale $1.5m", ParsedQuery("SOLUSDT", 2 * 604800, 1500000)),
+])
+def test_parse_query(text, expected):
+    assert parse_query(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "What's the sentiment on BTC today?",
+    "BTCUSDT",
+    "BTCUSDT 0h",
+    "BTCUSDT 3 fortnights",
+    "BTCUSDT 3h and ETHUSDT 1h",
+])
+def test_parse_query_leaves_free_text_to_the_agent(text):
+    assert parse_query(text) is None
+
+
+def test_parsed_query_window():
+    assert ParsedQuery("BTCUSDT", 90061).window() == (1, 1, 1)
+    assert ParsedQuery("BTCUSDT", 60).whale_threshold == DEFAULT_WHALE_THRESHOLD
+
+
+@pytest.mark.parametrize("text, seconds", [("4h", 14400), ("1 day", 86400), ("15m", 900), ("0m", None), ("soon", None)])
+def test_parse_window(text, seconds):
+    assert parse_window(text) == seconds
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from store import COLUMNS, TradeStore, slice_columns
+
+
+@pytest.fixture
+def trades():
+    """1000 consecutive trades, 100ms apart."""
+    rng = np.random.default_rng(0)
+    ids = np.arange(1000, 2000)
+    return {
+        "a": ids.astype(COLUMNS["a"]),
+        "T": (1_700_000_000_000 + (ids - 1000) * 100).astype(COLUMNS["T"]),
+        "p": rng.uniform(60_000, 61_000, 1000),
+        "q": rng.exponential(0.05, 1000),
+        "m": rng.random(1000) < 0.5,
+    }
+
+
+def test_append_continues_the_run(tmp_path, trades):
+    store = TradeStore("BTCUSDT", root=tmp_path)
+    assert store.append(slice_columns(trades, 0, 600)) == 600
+    # Already-stored ids are skipped
+    assert store.append(slice_columns(trades, 500, 1000)) == 400
+    assert np.array_equal(store.column("a"), trades["a"])
+
+
+def test_append_rejects_a_gap(tmp_path, trades):
+    store = TradeStore("BTCUSDT", root=tmp_path)
+    store.append(slice_columns(trades, 0, 100))
+    with pytest.raises(ValueError):
+        store.append(slice_columns(trades, 200, 300))
+
+
+def test_prepend_extends_backwards(tmp_path, trades):
+    store = TradeStore("BTCUSDT", root=tmp_path)
+    store.append(slice_columns(trades, 500, 1000))
+    assert store.prepend(slice_columns(trades, 0, 600)) == 500
+    assert np.array_equal(store.column("a"), trades["a"])
+
+
+def test_prepend_rejects_a_gap(tmp_path, trades):
+    store = TradeStore("BTCUSDT", root=tmp_path)
+    store.append(slice_columns(trades, 500, 1000))
+    with pytest.raises(ValueError):
+        store.prepend(slice_columns(trades, 0, 400))
+
+
+def test_trim_drops_old_trades(tmp_path, trades):
+    store = TradeStore("BTCUSDT", root=tmp_path)
+    store.append(trades)
+    cutoff = int(trades["T"][300])
+    assert store.trim(cutoff) == 300
+    assert store.first_time == cutoff
+    assert store.trim(cutoff) == 0
+    # The trimmed run is what another instance sees
+    assert TradeStore("BTCUSDT", root=tmp_path).first_id == int(trades["a"][300])
+
+
+def test_window_and_since(tmp_path, trades):
+    store = TradeStore("BTCUSDT", root=tmp_path)
+    store.append(trades)
+    window = store.window(int(trades["T"][100]), int(trades["T"][199]))
+    assert np.array_equal(window["a"], trades["a"][100:200])
+    assert np.array_equal(store.since(int(trades["a"][949]))["a"], trades["a"][950:])
+
+
+def test_interrupted_append_is_repaired(tmp_path, trades):
+    store = TradeStore("BTCUSDT", root=tmp_path)
+    store.append(slice_columns(trades, 0, 100))
+    # One column written further than the others, as after a crash mid-append
+    with open(store._file("a"), "ab") as f:
+        f.write(trades["a"][100:110].tobytes())
+    reopened = TradeStore("BTCUSDT", root=tmp_path)
+    assert len(reopened) == 100
+    assert reopened.append(slice_columns(trades, 100, 200)) == 100
+    assert np.array_equal(reopened.column("a"), trades["a"][:200])
+
+
+def test_lock_reloads_writes_from_another_instance(tmp_path, trades):
+    first = TradeStore("BTCUSDT", root=tmp_path)
+    second = TradeStore("BTCUSDT", root=tmp_path)
+    with first.lock:
+        first.append(slice_columns(trades, 0, 100))
+    with second.lock:
+        assert second.last_id == int(trades["a"][99])
+        second.reset(slice_columns(trades, 500, 600))
+    with first.lock:
+        assert first.first_id == int(trades["a"][500])
@@ -0,0 +1,140 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+import tool
+from conftest import SYMBOL, tape_window
+
+MINUTE = 60 * 1000
+HOUR = 60 * MINUTE
+
+
+def utc(ts):
+    return dt.datetime.fromtimestamp(ts / 1000, dt.timezone.utc)
+
+
+def test_fetch_range_parallel_matches_the_tape(binance, tape):
+    end_ts = int(tape["T"][-1])
+    trades = tool.fetch_range_parallel(SYMBOL, end_ts - 3 * HOUR, end_ts)
+    assert np.array_equal(trades["a"], tape_window(tape, end_ts - 3 * HOUR, end_ts)["a"])
+
+
+def test_fetch_range_parallel_retries_server_errors(binance, tape):
+    binance.error_rate = 0.2
+    end_ts = int(tape["T"][-1])
+    trades = tool.fetch_range_parallel(SYMBOL, end_ts - HOUR, end_ts)
+    assert np.array_equal(trades["a"], tape_window(tape, end_ts - HOUR, end_ts)["a"])
+
+
+def test_fetch_range_parallel_reports_progress(binance, tape):
+    end_ts = int(tape["T"][-1])
+    calls = []
+    token = tool.fetch_progress.set(lambda symbol, trades, done, total, whole: calls.append((done, total, whole)))
+    try:
+        tool.fetch_range_parallel(SYMBOL, end_ts - HOUR, end_ts, whole_window=True)
+    finally:
+        tool.fetch_progress.reset(token)
+    assert [done for done, _, _ in calls] == list(range(1, len(calls) + 1))
+    assert all(total == len(calls) and whole for _, total, whole in calls)
+
+
+def test_fetch_trades_matches_the_tape(binance, tape, trade_store):
+    end_ts = int(tape["T"][-1])
+    data = tool.fetch_trades(SYMBOL, utc(end_ts - 2 * HOUR), utc(end_ts), whale_threshold=5000)
+    expected = tape_window(tape, end_ts - 2 * HOUR, end_ts)
+    assert np.allclose(data, tool.aggregate_trades(expected, 5000))
+    assert np.allclose(data.histogram, tool.size_histogram(expected))
+
+
+def test_fetch_trades_with_rows_keeps_the_histogram(binance, tape, trade_store):
+    end_ts = int(tape["T"][-1])
+    data = tool.fetch_trades(SYMBOL, utc(end_ts - HOUR), utc(end_ts), return_trades=True)
+    expected = tape_window(tape, end_ts - HOUR, end_ts)
+    assert len(data) == 5 and len(data[4]) == len(expected["a"])
+    assert np.allclose(data[:4], tool.aggregate_trades(expected))
+    assert np.allclose(data.histogram, tool.size_histogram(expected))
+
+def assert_contiguous(store, tape, start_ts, end_ts):
+    ids = store.column("a")
+    assert np.all(np.diff(ids) == 1)
+    assert np.array_equal(store.window(start_ts, end_ts)["a"], tape_window(tape, start_ts, end_ts)["a"])
+
+
+def test_sync_store_appends_across_a_short_gap(binance, tape, trade_store):
+    # A long stored run, then a short window starting after its last trade
+    end_ts = int(tape["T"][-1])
+    tool.sync_store(trade_store, end_ts - 5 * HOUR, end_ts - 11 * MINUTE)
+    first_id = trade_store.first_id
+    requests = binance.requests
+    tool.sync_store(trade_store, end_ts - 5 * MINUTE, end_ts)
+    assert trade_store.first_id == first_id
+    assert_contiguous(trade_store, tape, end_ts - 5 * HOUR, end_ts)
+    assert binance.requests - requests < 5
+
+    # The long window is now served from the store: at most a page to check each edge
+    requests = binance.requests
+    tool.sync_store(trade_store, end_ts - 5 * HOUR, end_ts)
+    assert binance.requests - requests <= 2
+
+
+def test_sync_store_prepends_earlier_trades(binance, tape, trade_store):
+    end_ts = int(tape["T"][-1])
+    tool.sync_store(trade_store, end_ts - HOUR, end_ts)
+    tool.sync_store(trade_store, end_ts - 3 * HOUR, end_ts)
+    assert trade_store.first_time >= end_ts - 3 * HOUR
+    assert_contiguous(trade_store, tape, end_ts - 3 * HOUR, end_ts)
+
+
+def test_sync_store_resets_when_the_gap_outweighs_the_run(binance, tape, trade_store):
+    end_ts = int(tape["T"][-1])
+    tool.sync_store(trade_store, end_ts - 7 * HOUR, end_ts - 7 * HOUR + 10 * MINUTE)
+    tool.sync_store(trade_store, end_ts - 5 * MINUTE, end_ts)
+    assert trade_store.first_time >= end_ts - 5 * MINUTE
+    assert_contiguous(trade_store, tape, end_ts - 5 * MINUTE, end_ts)
+
+
+def test_sync_store_trims_beyond_retention(binance, tape, trade_store, monkeypatch):
+    monkeypatch.setattr(tool, "STORE_RETENTION_MS", HOUR)
+    end_ts = int(tape["T"][-1])
+    tool.sync_store(trade_store, end_ts - 4 * HOUR, end_ts - 5 * MINUTE)
+    tool.sync_store(trade_store, end_ts - 5 * MINUTE, end_ts)
+    assert end_ts - HOUR <= trade_store.first_time < end_ts - HOUR + MINUTE
+    assert_contiguous(trade_store, tape, end_ts - HOUR, end_ts)
+
+
+@pytest.mark.parametrize("window", [dt.timedelta(minutes=30), dt.timedelta(hours=2)])
+def test_rolling_sentiment_matches_a_full_recompute(binance, tape, trade_store, window):
+    rolling = tool.RollingSentiment(SYMBOL, window, whale_threshold=5000)
+    end_ts = int(tape["T"][-1])
+    for now in range(end_ts - 3 * HOUR, end_ts + 1, 17 * MINUTE + 3000):
+        data = rolling.refresh(utc(now))
+        trades = tape_window(tape, now - int(window.total_seconds() * 1000), now)
+        assert np.allclose(data, tool.aggregate_trades(trades, 5000))
+        assert np.allclose(data.histogram, tool.size_histogram(trades))
+
+
+def test_rolling_sentiment_rebuilds_after_a_store_reset(binance, tape, trade_store):
+    rolling = tool.RollingSentiment(SYMBOL, dt.timedelta(minutes=30))
+    end_ts = int(tape["T"][-1])
+    rolling.refresh(utc(end_ts - 6 * HOUR))
+    with trade_store.lock:
+        trade_store.reset()
+    data = rolling.refresh(utc(end_ts))
+    assert np.allclose(data, tool.aggregate_trades(tape_window(tape, end_ts - 30 * MINUTE, end_ts)))
+
+
+def test_approximate_taker_data_keeps_the_exact_taker_split(binance, tape):
+    end_ts = int(tape["T"][-1])
+    start_ts = (end_ts - 6 * HOUR) // HOUR * HOUR  # klines opening in the window cover it exactly
+    data = tool.approximate_taker_data(SYMBOL, start_ts, end_ts)
+    buy, sell, _, _ = tool.aggregate_trades(tape_window(tape, start_ts, end_ts))
+    assert data.approximate
+    assert data[0] == pytest.approx(buy) and data[1] == pytest.approx(sell)
+
+
+def test_analyze_sentiment_indices():
+    results = tool.analyze_sentiment(3.0, 1.0, 0.0, 2.0)
+    assert results["sentiment_index"] == pytest.approx(0.5)
+    assert results["whale_sentiment_index"] == pytest.approx(-1.0)
+    assert tool.analyze_sentiment(0, 0, 0, 0)["sentiment_index"] == 0
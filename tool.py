@@ -1,97 +1,635 @@
-from binance.client import Client
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import ContextVar, copy_context
 import datetime as dt
 import time
-import csv
 import os
+import random
+import operator
+import threading
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import Counter, Gauge, Histogram, record, stage
+from store import get_store, concat_columns, empty_columns, slice_columns
 
-# Initialize client (no API keys needed for public endpoints)
-client = Client()
+# Binance only accepts startTime/endTime pairs less than an hour apart
+MAX_TIME_SPAN_MS = 60 * 60 * 1000
+PAGE_LIMIT = 1000
 
+# Request weight of one aggTrades call, and the per-minute budget we allow
+# ourselves out of Binance's 6000/min IP limit
+AGG_TRADES_WEIGHT = 4
+KLINES_WEIGHT = 2
+WEIGHT_PER_MINUTE = int(os.getenv("BINANCE_WEIGHT_PER_MINUTE", "4800"))
 
-def fetch_trades(symbol, start_time, end_time, whale_threshold=100000):
-    """Fetch taker trades from Binance and save them to CSV."""
-    taker_buy_volume = 0
-    taker_sell_volume = 0
-    whale_buy_volume = 0
-    whale_sell_volume = 0
-    all_trades = []
-    last_id = None
-    total_count = 0
+# Long windows are split into sub-windows fetched by a bounded worker pool
+FETCH_WORKERS = int(os.getenv("BINANCE_FETCH_WORKERS", "8"))
+MIN_SUBWINDOW_MS = 5 * 60 * 1000
 
-    print(f"Fetching trades for {symbol} from {start_time} to {end_time} ...")
+# Symbols of a batch are analyzed concurrently; their fetches still share the
+# one request-weight budget below
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "8"))
+
+# Keep-alive connections kept to Binance: one per concurrent fetch, since
+# requests' default pool of 10 makes the extra workers reconnect every page
+BINANCE_POOL_SIZE = int(os.getenv("BINANCE_POOL_SIZE", str(FETCH_WORKERS + BATCH_WORKERS)))
+
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+
+# Windows this long are approximated from klines plus sampled trades
+APPROX_MIN_WINDOW = dt.timedelta(hours=float(os.getenv("APPROX_MIN_WINDOW_HOURS", "72")))
+APPROX_SAMPLES = 12
+APPROX_SAMPLE_MS = 5 * 60 * 1000
+KLINE_INTERVAL = "1h"
+
+# The trade store keeps this much history (by default the longest exact
+# window); older trades are trimmed once they exceed it by a quarter
+STORE_RETENTION_MS = int(float(os.getenv(
+    "TRADE_STORE_RETENTION_HOURS", str(APPROX_MIN_WINDOW.total_seconds() / 3600))) * 3600 * 1000)
+
+# Trade-size tiers (USD notional lower bounds). Volume is also tallied per
+# tier in the same pass, so sentiment can be compared across trade sizes
+SIZE_TIERS = np.array([float(t) for t in os.getenv("SIZE_TIERS", "10000,50000,100000,250000,1000000").split(",")])
+
+# Rolling windows are bucketed per minute; only this many are kept alive
+MINUTE_MS = 60 * 1000
+ROLLING_STATES = 64
+
+_AGG_FIELDS = operator.itemgetter('a', 'T', 'p', 'q', 'm')
+
+BINANCE_REQUESTS = Counter("binance_requests_total", "Binance REST calls by outcome", ["method", "outcome"])
+BINANCE_RETRIES = Counter("binance_retries_total", "Binance REST calls retried after an error", ["method"])
+BINANCE_SECONDS = Histogram("binance_request_seconds", "Latency of Binance REST calls", ["method"])
+BINANCE_WEIGHT = Counter("binance_weight_total", "Request weight spent against the per-minute limit", ["method"])
+BINANCE_USED_WEIGHT = Gauge("binance_used_weight_1m", "Last X-MBX-USED-WEIGHT-1M reported by Binance")
+RATE_LIMIT_WAIT = Counter("binance_rate_limit_wait_seconds_total", "Time spent waiting for the request rate limiter")
+PAGES_FETCHED = Counter("binance_pages_total", "aggTrades pages fetched", ["symbol"])
+TRADES_FETCHED = Counter("binance_trades_total", "aggTrades downloaded", ["symbol"])
+
+
+def pool_session(session, size=BINANCE_POOL_SIZE):
+    """Give a requests session a keep-alive pool of ``size`` connections per host."""
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Binance client (no API keys needed for public endpoints), built on first
+# use. Its pooled session lives for the whole process; close_client()
+# releases it at shutdown
+client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                # Imported here: python-binance takes ~0.5s to import
+                from binance.client import Client
+
+                # ping=False: no network round trip just to construct it
+                new_client = Client(requests_params={"timeout": 10}, ping=False)
+                pool_session(new_client.session)
+                client = new_client
+    return client
+
+
+def close_client():
+    global client
+    with _client_lock:
+        if client is not None:
+            client.close_connection()
+            client = None
 
-    start_ts = int(start_time.timestamp() * 1000)
-    end_ts = int(end_time.timestamp() * 1000)
+
+class FetchError(Exception):
+    """Raised when trades cannot be fetched from Binance."""
+
+
+class AbortSignal:
+    """Abort flag for a fetch, optionally chained to a parent signal."""
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self._event = threading.Event()
+
+    def set(self):
+        self._event.set()
+
+    def is_set(self):
+        return self._event.is_set() or (self.parent is not None and self.parent.is_set())
+
+
+# Set by callers (e.g. the API) to abort the fetches of a cancelled request
+fetch_abort = ContextVar("fetch_abort", default=None)
+
+# Optional callback(symbol, trades, done, total, whole_window), called as each
+# sub-window arrives; whole_window tells whether the fetch spans the caller's
+# entire window (a cold fetch) or only extends what is already stored
+fetch_progress = ContextVar("fetch_progress", default=None)
+
+# Optional in-memory source of recent trades (see ingest.Ingestor). Its
+# volumes(symbol, start_ts, end_ts, whale_threshold) returns TakerData, or
+# None when it doesn't cover the window.
+live_source = None
+
+
+class TokenBucket:
+    """Thread-safe token bucket for Binance request weight."""
+
+    def __init__(self, capacity, refill_per_sec):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until ``tokens`` are available, then take them; returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_sec)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                wait = max(self.paused_until - now, (tokens - self.tokens) / self.refill_per_sec)
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds):
+        """Stop handing out tokens for ``seconds`` (e.g. after a 429)."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+rate_limiter = TokenBucket(WEIGHT_PER_MINUTE, WEIGHT_PER_MINUTE / 60)
+_fetch_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="binance-fetch")
+# Separate from _fetch_pool: batch workers block on sub-window fetches submitted there
+_batch_pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch")
+
+
+def page_to_columns(trades):
+    """Convert one page of aggTrades (list of dicts) into trade columns."""
+    if not trades:
+        return empty_columns()
+    ids, times, prices, qtys, makers = zip(*map(_AGG_FIELDS, trades))
+    return {
+        "a": np.array(ids, dtype=np.int64),
+        "T": np.array(times, dtype=np.int64),
+        "p": np.array(prices, dtype=np.float64),
+        "q": np.array(qtys, dtype=np.float64),
+        "m": np.array(makers, dtype=np.bool_),
+    }
+
+
+def aggregate_trades(trades, whale_threshold=100000):
+    """Sum taker buy/sell and whale buy/sell volume over trade columns."""
+    price, qty, is_sell = trades["p"], trades["q"], trades["m"]
+    is_whale = price * qty >= whale_threshold
+
+    taker_sell_volume = float(qty.sum(where=is_sell))
+    taker_buy_volume = float(qty.sum(where=~is_sell))
+    whale_sell_volume = float(qty.sum(where=is_sell & is_whale))
+    whale_buy_volume = float(qty.sum(where=~is_sell & is_whale))
+
+    return taker_buy_volume, taker_sell_volume, whale_buy_volume, whale_sell_volume
+
+
+def minute_buckets(trades, whale_threshold=100000):
+    """
+    Per-minute aggregate_trades: returns the minutes (``T // MINUTE_MS``)
+    that have trades, the index of each trade's minute, and an ``(N, 4)``
+    array of buy, sell, whale buy and whale sell volume per minute.
+    """
+    minutes, inverse = np.unique(trades["T"] // MINUTE_MS, return_inverse=True)
+    qty, is_sell = trades["q"], trades["m"]
+    is_whale = trades["p"] * qty >= whale_threshold
+    sums = np.stack([
+        np.bincount(inverse, weights=qty * ~is_sell, minlength=len(minutes)),
+        np.bincount(inverse, weights=qty * is_sell, minlength=len(minutes)),
+        np.bincount(inverse, weights=qty * (~is_sell & is_whale), minlength=len(minutes)),
+        np.bincount(inverse, weights=qty * (is_sell & is_whale), minlength=len(minutes)),
+    ], axis=1)
+    return minutes, inverse, sums
+
+
+def size_histogram(trades, tiers=SIZE_TIERS):
+    """
+    Taker ``[buy, sell]`` volume per trade-size bin: row 0 holds trades below
+    ``tiers[0]``, row ``k`` those from ``tiers[k-1]`` up to ``tiers[k]``.
+    """
+    bins = np.searchsorted(tiers, trades["p"] * trades["q"], side="right")
+    qty, is_sell = trades["q"], trades["m"]
+    return np.stack([
+        np.bincount(bins, weights=qty * ~is_sell, minlength=len(tiers) + 1),
+        np.bincount(bins, weights=qty * is_sell, minlength=len(tiers) + 1),
+    ], axis=1)
+
+
+def running_volumes(running, trades, whale_threshold=100000):
+    """Add trade columns to running ``[buy, sell, whale buy, whale sell, trades]`` sums (or start them)."""
+    part = aggregate_trades(trades, whale_threshold) + (len(trades["a"]),)
+    return [a + b for a, b in zip(running or (0,) * 5, part)]
+
+
+def trades_to_list(trades):
+    """Expand trade columns into ``[timestamp, price, qty, side]`` rows."""
+    return [
+        [dt.datetime.fromtimestamp(t / 1000, dt.timezone.utc), p, q, "SELL" if m else "BUY"]
+        for t, p, q, m in zip(trades["T"].tolist(), trades["p"].tolist(), trades["q"].tolist(), trades["m"].tolist())
+    ]
+
+
+def binance_call(method, weight, symbol, abort=None, **params):
+    """One public REST call, rate limited and retried with exponential backoff."""
+    from binance.exceptions import BinanceAPIException, BinanceRequestException
+
+    for attempt in range(MAX_RETRIES):
+        if abort is not None and abort.is_set():
+            raise FetchError(f"Fetch of {symbol} aborted")
+        waited = rate_limiter.acquire(weight)
+        RATE_LIMIT_WAIT.inc(waited)
+        BINANCE_WEIGHT.inc(weight, method=method)
+        record("rate_limit_wait_seconds", waited)
+        record("binance_requests", 1)
+        start = time.perf_counter()
+        try:
+            result = getattr(get_client(), method)(symbol=symbol, **params)
+            BINANCE_REQUESTS.inc(method=method, outcome="ok")
+            _track_used_weight(get_client().response)
+            return result
+        except BinanceAPIException as e:
+            _track_used_weight(e.response)
+            if e.status_code in (418, 429):
+                BINANCE_REQUESTS.inc(method=method, outcome="rate_limited")
+                retry_after = int(e.response.headers.get("Retry-After", 0) or 0)
+                rate_limiter.pause(max(retry_after, BACKOFF_BASE * 2 ** attempt))
+            elif e.status_code < 500:
+                # Bad symbol or parameters: retrying won't help
+                BINANCE_REQUESTS.inc(method=method, outcome="rejected")
+                raise FetchError(f"Binance rejected {symbol}: {e.message}") from e
+            else:
+                BINANCE_REQUESTS.inc(method=method, outcome="server_error")
+            error = e
+        except (requests.RequestException, BinanceRequestException) as e:
+            BINANCE_REQUESTS.inc(method=method, outcome="network_error")
+            error = e
+        finally:
+            BINANCE_SECONDS.observe(time.perf_counter() - start, method=method)
+
+        BINANCE_RETRIES.inc(method=method)
+        record("binance_retries", 1)
+        delay = BACKOFF_BASE * 2 ** attempt * (1 + random.random())
+        print(f"Error fetching {symbol}: {error} (retrying in {delay:.1f}s)")
+        time.sleep(delay)
+
+    raise FetchError(f"Giving up on {symbol} after {MAX_RETRIES} attempts: {error}")
+
+
+def _track_used_weight(response):
+    """Update the used-weight gauge from a Binance response's headers."""
+    used = response is not None and response.headers.get("X-MBX-USED-WEIGHT-1M")
+    if used:
+        BINANCE_USED_WEIGHT.set(int(used))
+
+
+def get_page(symbol, abort=None, **params):
+    """One page of aggTrades."""
+    trades = binance_call("get_aggregate_trades", AGG_TRADES_WEIGHT, symbol, abort, limit=PAGE_LIMIT, **params)
+    PAGES_FETCHED.inc(symbol=symbol)
+    TRADES_FETCHED.inc(len(trades), symbol=symbol)
+    record("pages", 1)
+    record("trades_fetched", len(trades))
+    return trades
+
+
+def fetch_range(symbol, start_ts, end_ts, abort=None):
+    """
+    Page sequentially through the aggTrades with ``start_ts <= T <= end_ts``.
+
+    Stops early with FetchError once the optional ``abort`` event is set.
+    """
+    pages = []
+    from_id = None
+    cursor = start_ts
 
     while True:
-        params = {"symbol": symbol, "limit": 1000}
-        if last_id:
-            params["fromId"] = last_id + 1
+        if from_id is not None:
+            trades = get_page(symbol, abort, fromId=from_id)
+            exhausted = len(trades) < PAGE_LIMIT
         else:
-            params["startTime"] = start_ts
-            params["endTime"] = end_ts
+            span_end = min(cursor + MAX_TIME_SPAN_MS - 1, end_ts)
+            trades = get_page(symbol, abort, startTime=cursor, endTime=span_end)
+            if not trades and span_end < end_ts:
+                # Quiet hour: look for the first trade in the next one
+                cursor = span_end + 1
+                continue
+            exhausted = len(trades) < PAGE_LIMIT and span_end == end_ts
 
-        try:
-            trades = client.get_aggregate_trades(**params)
-        except Exception as e:
-            print(f"Error fetching trades: {e}")
-            time.sleep(1)
-            continue
+        if not trades:
+            break
+
+        pages.append(page_to_columns(trades))
+        from_id = trades[-1]['a'] + 1
+
+        if trades[-1]['T'] > end_ts or exhausted:
+            break
 
+    trades = concat_columns(pages)
+    return slice_columns(trades, 0, int(np.searchsorted(trades["T"], end_ts, side="right")))
+
+
+def fetch_id_range(symbol, first_id, last_id, abort=None):
+    """Page through the aggTrades with ``first_id <= a <= last_id``."""
+    pages = []
+    from_id = first_id
+    while from_id <= last_id:
+        trades = get_page(symbol, abort, fromId=from_id)
         if not trades:
             break
+        pages.append(page_to_columns(trades))
+        from_id = trades[-1]['a'] + 1
+
+    trades = concat_columns(pages)
+    return slice_columns(trades, 0, int(np.searchsorted(trades["a"], last_id, side="right")))
+
+
+def fetch_range_parallel(symbol, start_ts, end_ts, whole_window=False):
+    """
+    Fetch ``start_ts <= T <= end_ts`` as concurrent sub-windows.
+
+    Sub-windows are paged by the shared worker pool under the shared rate
+    limiter and merged back in aggregate trade id order. Setting the
+    ``fetch_abort`` signal of the calling context stops the fetch, and its
+    ``fetch_progress`` callback is told about every finished sub-window.
+    ``whole_window`` is passed on to it.
+    """
+    span = end_ts - start_ts + 1
+    count = max(1, min(span // MIN_SUBWINDOW_MS, FETCH_WORKERS * 4))
+    step = -(-span // count)
+    bounds = [(s, min(s + step - 1, end_ts)) for s in range(start_ts, end_ts + 1, step)]
+
+    abort = AbortSignal(parent=fetch_abort.get())
+    progress = fetch_progress.get()
+    futures = {
+        _fetch_pool.submit(copy_context().run, fetch_range, symbol, s, e, abort): i for i, (s, e) in enumerate(bounds)
+    }
+    parts = [None] * len(bounds)
+    fetched = 0
+    try:
+        for done, future in enumerate(as_completed(futures), 1):
+            part = parts[futures[future]] = future.result()
+            fetched += len(part["a"])
+            print(f"Fetched {fetched} trades ({done}/{len(bounds)} sub-windows)...", end="\r")
+            if progress is not None:
+                progress(symbol, part, done, len(bounds), whole_window)
+    except BaseException:
+        abort.set()
+        for future in futures:
+            future.cancel()
+        raise
+
+    trades = concat_columns(parts)
+    _, first = np.unique(trades["a"], return_index=True)
+    if len(first) != len(trades["a"]):
+        trades = {name: col[first] for name, col in trades.items()}
+    return trades
+
+
+def sync_store(store, start_ts, end_ts):
+    """
+    Download whatever part of ``[start_ts, end_ts]`` is missing from the store.
+
+    A gap between the stored run and the range is downloaded too, so the run
+    stays contiguous, unless the gap is longer than both the range and the
+    part of the run still within the retention period: then the run is
+    replaced. Trades older than the retention period are trimmed.
+    """
+    with stage("fetch"):
+        retention = max(STORE_RETENTION_MS, end_ts - start_ts)
+        horizon = end_ts - retention
+        if len(store):
+            gap = max(start_ts - store.last_time, store.first_time - end_ts)
+            useful = store.last_time - max(store.first_time, horizon)
+        if len(store) == 0 or gap > max(end_ts - start_ts, useful):
+            # Nothing stored, or the stored run is worth less than the gap to it
+            store.reset(fetch_range_parallel(store.symbol, start_ts, end_ts, whole_window=True))
+            return
+
+        if start_ts < store.first_time:
+            store.prepend(fetch_range_parallel(store.symbol, start_ts, store.first_time))
+
+        if end_ts > store.last_time:
+            store.append(fetch_range_parallel(store.symbol, store.last_time, end_ts))
+
+        if store.first_time < horizon - retention // 4:
+            store.trim(horizon)
+
 
-        for trade in trades:
-            qty = float(trade['q'])
-            price = float(trade['p'])
-            timestamp = dt.datetime.fromtimestamp(trade['T'] / 1000, dt.timezone.utc)
-            trade_value = qty * price 
-
-            if trade['m']:  # Buyer is taker → SELL
-                taker_sell_volume += qty
-                side = "SELL" 
-                if trade_value >= whale_threshold:
-                    whale_sell_volume += qty
-            else:  # Seller is taker → BUY
-                taker_buy_volume += qty
-                side = "BUY"
-                if trade_value >= whale_threshold:
-                    whale_buy_volume += qty
-
-            all_trades.append([timestamp, price, qty, side])
-            total_count += 1
-
-        last_id = trades[-1]['a']
-        if trades[-1]['T'] > end_ts:
+def fetch_trades(symbol, start_time, end_time, whale_threshold=100000, return_trades=False):
+    """
+    Fetch taker trades for a time window, reusing the local trade store.
+
+    Returns buy, sell, whale buy and whale sell volume as TakerData (with
+    the size_histogram of the window). With ``return_trades=True`` the
+    ``[timestamp, price, qty, side]`` rows of the window are appended as a
+    fifth item.
+    """
+    print(f"Fetching trades for {symbol} from {start_time} to {end_time} ...")
+
+    start_ts = int(start_time.timestamp() * 1000)
+    end_ts = int(end_time.timestamp() * 1000)
+
+    store = get_store(symbol)
+    with store.lock:
+        sync_store(store, start_ts, end_ts)
+        with stage("aggregate"):
+            trades = store.window(start_ts, end_ts)
+            volumes = aggregate_trades(trades, whale_threshold)
+            if return_trades:
+                volumes = (*volumes, trades_to_list(trades))
+            volumes = TakerData(volumes, histogram=size_histogram(trades))
+
+    print(f"\nFinished fetching {len(trades['a'])} trades.")
+
+    return volumes
+
+
+class TakerData(tuple):
+    """
+    ``(buy, sell, whale buy, whale sell)`` volumes. ``approximate`` is set
+    when they were estimated from klines and sampled trades; ``histogram`` is
+    the window's size_histogram, if known.
+    """
+
+    def __new__(cls, volumes, approximate=False, histogram=None):
+        data = super().__new__(cls, volumes)
+        data.approximate = approximate
+        data.histogram = histogram
+        return data
+
+
+def fetch_klines(symbol, start_ts, end_ts, interval=KLINE_INTERVAL, abort=None):
+    """Return ``(volume, taker buy volume)`` columns of the klines opening in the window."""
+    rows = []
+    cursor = start_ts
+    while cursor <= end_ts:
+        klines = binance_call("get_klines", KLINES_WEIGHT, symbol, abort,
+                              interval=interval, startTime=cursor, endTime=end_ts, limit=PAGE_LIMIT)
+        if not klines:
+            break
+        rows.extend((float(k[5]), float(k[9])) for k in klines)
+        cursor = klines[-1][0] + 1
+        if len(klines) < PAGE_LIMIT:
             break
+    return np.array(rows, dtype=np.float64).reshape(-1, 2)
 
-        print(f"Fetched {total_count} trades...", end="\r")
-        time.sleep(0.2)
 
-    print(f"\nFinished fetching {total_count} trades.")
+def approximate_taker_data(symbol, start_ts, end_ts, whale_threshold=100000):
+    """
+    Estimate the window's volumes without downloading every trade.
 
-    return taker_buy_volume, taker_sell_volume, whale_buy_volume, whale_sell_volume
+    The taker buy/sell split comes exactly from the klines' taker buy volume.
+    Whale volume is estimated from APPROX_SAMPLES short slices of real trades,
+    spread evenly over the window (the last one ending now): the whale share
+    of buy and sell volume in the slices is applied to the kline totals.
+    """
+    abort = AbortSignal(parent=fetch_abort.get())
+    with stage("fetch"):
+        klines = fetch_klines(symbol, start_ts, end_ts, abort=abort)
+        starts = np.linspace(start_ts, end_ts - APPROX_SAMPLE_MS, APPROX_SAMPLES).astype(np.int64)
+        futures = [
+            _fetch_pool.submit(copy_context().run, fetch_range, symbol, int(s), int(s) + APPROX_SAMPLE_MS - 1, abort)
+            for s in starts
+        ]
+        try:
+            sample = concat_columns([future.result() for future in futures])
+        except BaseException:
+            abort.set()
+            raise
+
+    buy_volume = float(klines[:, 1].sum())
+    sell_volume = float(klines[:, 0].sum()) - buy_volume
+    sample_buy, sample_sell, sample_whale_buy, sample_whale_sell = aggregate_trades(sample, whale_threshold)
 
+    whale_buy = buy_volume * sample_whale_buy / sample_buy if sample_buy else 0.0
+    whale_sell = sell_volume * sample_whale_sell / sample_sell if sample_sell else 0.0
+    # Size tiers are scaled the same way
+    scale = np.array([buy_volume / sample_buy if sample_buy else 0.0, sell_volume / sample_sell if sample_sell else 0.0])
+    histogram = size_histogram(sample) * scale
+    return TakerData((buy_volume, sell_volume, whale_buy, whale_sell), approximate=True, histogram=histogram)
 
-def get_taker_data(symbol="BTCUSDT", days=0, hours=0, minutes=0, whale_threshold=100000):
+
+def get_taker_data(symbol="BTCUSDT", days=0, hours=0, minutes=0, whale_threshold=100000, mode="auto"):
     """
     Get taker trade data for a given symbol and timeframe.
     Example:
         - days=1 → last 24 hours
         - hours=6 → last 6 hours
         - minutes=30 → last 30 minutes
+
+    Recent windows are answered from the live ingestion buffers when they
+    cover them. Otherwise repeated calls for the same window reuse its
+    rolling state, so only the trades since the previous call are fetched.
+
+    ``mode`` is "exact", "approx" (see approximate_taker_data) or "auto",
+    which approximates windows of APPROX_MIN_WINDOW or longer.
+    """
+    window = dt.timedelta(days=days, hours=hours, minutes=minutes)
+    end_ts = int(time.time() * 1000)
+    start_ts = end_ts - int(window.total_seconds() * 1000)
+
+    if mode != "approx":
+        data = live_taker_data(symbol, start_ts, end_ts, whale_threshold)
+        if data is not None:
+            return data
+    if mode == "approx" or (mode == "auto" and window >= APPROX_MIN_WINDOW):
+        return approximate_taker_data(symbol, start_ts, end_ts, whale_threshold)
+    return rolling_sentiment(symbol, window, whale_threshold).refresh()
+
+
+def live_taker_data(symbol, start_ts, end_ts, whale_threshold=100000):
+    """TakerData of the window from live_source, or None if it doesn't cover it."""
+    if live_source is None:
+        return None
+    with stage("live"):
+        return live_source.volumes(symbol.upper(), start_ts, end_ts, whale_threshold)
+
+
+def get_taker_data_many(symbols, days=0, hours=0, minutes=0, whale_threshold=100000, mode="auto"):
+    """
+    get_taker_data for several symbols at once, BATCH_WORKERS at a time.
+
+    Returns ``{symbol: TakerData}``; a symbol that couldn't be fetched maps to
+    its exception instead, so one bad pair doesn't fail the batch.
+    """
+    futures = {
+        _batch_pool.submit(copy_context().run, get_taker_data, symbol, days, hours, minutes, whale_threshold, mode): symbol
+        for symbol in dict.fromkeys(symbol.upper() for symbol in symbols)
+    }
+    results = {}
+    try:
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = e
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+    return {symbol: results[symbol] for symbol in futures.values()}
+
+
+def analyze_window(symbol, seconds, whale_threshold=100000):
     """
-    end_time = dt.datetime.now(dt.timezone.utc)
-    start_time = end_time - dt.timedelta(days=days, hours=hours, minutes=minutes)
+    analyze_sentiment of the last ``seconds`` of ``symbol``, with its size
+    tiers and "approximate" flag. This is the unit of work of an analysis job.
+    """
+    days, rest = divmod(seconds, 86400)
+    hours, rest = divmod(rest, 3600)
+    data = get_taker_data(symbol, days, hours, rest // 60, whale_threshold)
+    return window_results(data)
+
 
-    
-    data = fetch_trades(symbol, start_time, end_time, whale_threshold)
+def window_results(data):
+    """The analysis dict of a TakerData."""
+    results = analyze_sentiment(*data, histogram=data.histogram)
+    results["approximate"] = data.approximate
+    return results
 
-    return data
 
+def tier_sentiment(histogram, tiers=SIZE_TIERS):
+    """Buy/sell volume and sentiment index of the trades at or above each tier."""
+    # Sum the bins from the top down: row k holds everything >= tiers[k]
+    at_least = np.cumsum(histogram[::-1], axis=0)[::-1][1:]
+    rows = []
+    for tier, (buy, sell) in zip(tiers.tolist(), at_least.tolist()):
+        total = buy + sell
+        rows.append({
+            "min_notional": tier,
+            "buy_volume": buy,
+            "sell_volume": sell,
+            "sentiment_index": (buy - sell) / total if total > 0 else 0,
+        })
+    return rows
 
-def analyze_sentiment(buy_vol, sell_vol, whale_buy, whale_sell):
-    """Calculate sentiment indices for both retail and whales."""
+
+def analyze_sentiment(buy_vol, sell_vol, whale_buy, whale_sell, histogram=None):
+    """
+    Calculate sentiment indices for both retail and whales. Given a
+    size_histogram, "tiers" holds the sentiment of each size tier as well.
+    """
     total_vol = buy_vol + sell_vol
     sentiment_index = (buy_vol - sell_vol) / total_vol if total_vol > 0 else 0
 
@@ -105,9 +643,100 @@ def analyze_sentiment(buy_vol, sell_vol, whale_buy, whale_sell):
         "whale_buy_volume": whale_buy,
         "whale_sell_volume": whale_sell,
         "whale_sentiment_index": whale_index,
+        **({"tiers": tier_sentiment(histogram)} if histogram is not None else {}),
     }
 
 
+class RollingSentiment:
+    """
+    Rolling taker/whale volume for one symbol, window and whale threshold.
+
+    Volume is kept in per-minute buckets of ``[buy, sell, whale buy, whale
+    sell]`` followed by the minute's flattened size_histogram, plus running
+    totals. ``refresh()`` only aggregates the trades
+    since the last seen aggregate trade id and drops the buckets that slid out
+    of the window, so each refresh is O(new trades). The partial minute at the
+    start of the window is summed exactly from the trade store.
+    """
+
+    def __init__(self, symbol, window, whale_threshold=100000):
+        self.symbol = symbol
+        self.window_ms = int(window.total_seconds() * 1000)
+        self.whale_threshold = whale_threshold
+        self.buckets = OrderedDict()  # minute -> np.array([buy, sell, whale_buy, whale_sell, *histogram])
+        self.width = 4 + 2 * (len(SIZE_TIERS) + 1)
+        self.totals = np.zeros(self.width)
+        self.last_id = None
+        self.lock = threading.Lock()
+
+    def refresh(self, now=None):
+        """Bring the window up to ``now`` and return its TakerData."""
+        now = now or dt.datetime.now(dt.timezone.utc)
+        end_ts = int(now.timestamp() * 1000)
+        start_ts = end_ts - self.window_ms
+        first_minute = -(-start_ts // MINUTE_MS)  # first minute fully inside the window
+
+        store = get_store(self.symbol)
+        with store.lock, self.lock:
+            sync_store(store, start_ts, end_ts)
+            with stage("aggregate"):
+                if self.last_id is None or not len(store) or not store.first_id - 1 <= self.last_id <= store.last_id:
+                    # First refresh, or the store started a new run: rebuild
+                    self.buckets.clear()
+                    self.totals = np.zeros(self.width)
+                    self.last_id = None
+                    new = store.window(first_minute * MINUTE_MS, store.last_time or end_ts)
+                else:
+                    new = store.since(self.last_id)
+
+                self._add(new)
+                self._expire(first_minute)
+                head = store.window(start_ts, first_minute * MINUTE_MS - 1)
+                head = np.concatenate([aggregate_trades(head, self.whale_threshold), size_histogram(head).ravel()])
+                # Clamp float drift from adding and expiring buckets
+                totals = np.maximum(self.totals + head, 0.0)
+
+        return TakerData(tuple(totals[:4].tolist()), histogram=totals[4:].reshape(-1, 2))
+
+    def _add(self, trades):
+        if not len(trades["a"]):
+            return
+        minutes, inverse, sums = minute_buckets(trades, self.whale_threshold)
+        # Per-minute size histogram, flattened as [bin0 buy, bin0 sell, bin1 buy, ...]
+        qty = trades["q"]
+        bins = len(SIZE_TIERS) + 1
+        cell = (inverse * bins + np.searchsorted(SIZE_TIERS, trades["p"] * qty, side="right")) * 2 + trades["m"]
+        histogram = np.bincount(cell, weights=qty, minlength=len(minutes) * bins * 2).reshape(len(minutes), -1)
+        sums = np.concatenate([sums, histogram], axis=1)
+        for minute, volumes in zip(minutes.tolist(), sums):
+            if minute in self.buckets:
+                self.buckets[minute] += volumes
+            else:
+                self.buckets[minute] = volumes
+        self.totals += sums.sum(axis=0)
+        self.last_id = int(trades["a"][-1])
+
+    def _expire(self, first_minute):
+        while self.buckets and next(iter(self.buckets)) < first_minute:
+            _, volumes = self.buckets.popitem(last=False)
+            self.totals -= volumes
+
+
+_rolling_states = OrderedDict()
+_rolling_lock = threading.Lock()
+
+
+def rolling_sentiment(symbol, window, whale_threshold=100000):
+    """Return the shared RollingSentiment for a window, keeping the most recent few."""
+    key = (symbol.upper(), int(window.total_seconds()), whale_threshold)
+    with _rolling_lock:
+        state = _rolling_states.pop(key, None) or RollingSentiment(key[0], window, whale_threshold)
+        _rolling_states[key] = state
+        while len(_rolling_states) > ROLLING_STATES:
+            _rolling_states.popitem(last=False)
+        return state
+
+
 if __name__ == "__main__":
     # Example usage
     symbol = "LINKUSDT"
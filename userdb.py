@@ -0,0 +1,195 @@
+import json
+import os
+import sqlite3
+import threading
+
+# SQLite database holding saved signals and active loops
+USER_DB_FILE = os.getenv("USER_DB_FILE", "data/users.db")
+# Pre-SQLite store, imported once on first open
+LEGACY_JSON_FILE = "data/user_data.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signals (
+    user_id         TEXT PRIMARY KEY,
+    symbol          TEXT NOT NULL,
+    timeframe       TEXT NOT NULL,
+    whale_threshold REAL
+);
+CREATE TABLE IF NOT EXISTS loops (
+    user_id         TEXT PRIMARY KEY,
+    symbol          TEXT NOT NULL,
+    timeframe       TEXT NOT NULL,
+    whale_threshold REAL,
+    interval        INTEGER NOT NULL,
+    interval_str    TEXT NOT NULL,
+    next_run        REAL NOT NULL  -- unix time
+);
+CREATE TABLE IF NOT EXISTS alerts (
+    id              INTEGER PRIMARY KEY,
+    user_id         TEXT NOT NULL,
+    symbol          TEXT NOT NULL,
+    timeframe       TEXT NOT NULL,
+    whale_threshold REAL,
+    metric          TEXT NOT NULL,  -- whale, retail, divergence
+    op              TEXT NOT NULL,  -- > or <
+    threshold       REAL NOT NULL,
+    narrative       INTEGER NOT NULL DEFAULT 0,
+    armed           INTEGER NOT NULL DEFAULT 1,
+    last_fired      REAL  -- unix time
+);
+CREATE INDEX IF NOT EXISTS alerts_user ON alerts (user_id);
+"""
+
+
+class UserStore:
+    """
+    Saved signals and loop definitions, one row per user, and alert rules.
+
+    Runs in WAL mode so readers in other processes (the API's live ingestion)
+    don't block the bot's writes; every change is a single-row upsert in its
+    own transaction.
+    """
+
+    def __init__(self, path=USER_DB_FILE, legacy_json=LEGACY_JSON_FILE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.executescript(SCHEMA)
+        if legacy_json:
+            self._migrate_json(legacy_json)
+
+    def _migrate_json(self, path):
+        """Import the legacy user_data.json once, then rename it out of the way."""
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path) as f:
+                signals = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Skipping migration of {path}: {e}")
+            return
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO signals (user_id, symbol, timeframe, whale_threshold) VALUES (?, ?, ?, ?)",
+                [(str(user_id), signal["symbol"], signal["timeframe"], signal.get("whale_threshold"))
+                 for user_id, signal in signals.items() if signal.get("symbol") and signal.get("timeframe")],
+            )
+        os.replace(path, path + ".migrated")
+        print(f"Migrated {len(signals)} saved signals from {path}")
+
+    # -------- SIGNALS -------- #
+    def signals(self):
+        """All saved signals as ``{user_id: signal}``."""
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM signals").fetchall()
+        return {row["user_id"]: _signal(row) for row in rows}
+
+    def save_signal(self, user_id, signal):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO signals (user_id, symbol, timeframe, whale_threshold) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET symbol=excluded.symbol, timeframe=excluded.timeframe, "
+                "whale_threshold=excluded.whale_threshold",
+                (user_id, signal["symbol"], signal["timeframe"], signal.get("whale_threshold")),
+            )
+
+    def signal_symbols(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT DISTINCT upper(symbol) FROM signals").fetchall()
+        return {row[0] for row in rows}
+
+    # -------- LOOPS -------- #
+    def loops(self):
+        """All persisted loops as ``{user_id: loop}`` (``next_run`` in unix time)."""
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM loops").fetchall()
+        return {
+            row["user_id"]: {
+                **_signal(row),
+                "interval": row["interval"],
+                "interval_str": row["interval_str"],
+                "next_run": row["next_run"],
+            }
+            for row in rows
+        }
+
+    def save_loop(self, user_id, loop):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO loops (user_id, symbol, timeframe, whale_threshold, interval, interval_str, next_run) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET symbol=excluded.symbol, timeframe=excluded.timeframe, "
+                "whale_threshold=excluded.whale_threshold, interval=excluded.interval, "
+                "interval_str=excluded.interval_str, next_run=excluded.next_run",
+                (user_id, loop["symbol"], loop["timeframe"], loop.get("whale_threshold"),
+                 loop["interval"], loop["interval_str"], loop["next_run"]),
+            )
+
+    def set_next_runs(self, next_runs):
+        """Record the next run time of several loops, ``{user_id: unix time}``, in one transaction."""
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("UPDATE loops SET next_run = ? WHERE user_id = ?",
+                                  [(next_run, user_id) for user_id, next_run in next_runs.items()])
+
+    def delete_loop(self, user_id):
+        with self.lock:
+            self.conn.execute("DELETE FROM loops WHERE user_id = ?", (user_id,))
+
+    # -------- ALERTS -------- #
+    def alerts(self):
+        """All alert rules as ``{user_id: [alert, ...]}``."""
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM alerts ORDER BY id").fetchall()
+        alerts = {}
+        for row in rows:
+            alerts.setdefault(row["user_id"], []).append({
+                **_signal(row),
+                "id": row["id"],
+                "metric": row["metric"],
+                "op": row["op"],
+                "threshold": row["threshold"],
+                "narrative": bool(row["narrative"]),
+                "armed": bool(row["armed"]),
+                "last_fired": row["last_fired"],
+            })
+        return alerts
+
+    def add_alert(self, user_id, alert):
+        """Store a new alert rule; returns its id."""
+        with self.lock:
+            return self.conn.execute(
+                "INSERT INTO alerts (user_id, symbol, timeframe, whale_threshold, metric, op, threshold, narrative, armed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, alert["symbol"], alert["timeframe"], alert.get("whale_threshold"),
+                 alert["metric"], alert["op"], alert["threshold"], int(alert["narrative"]), int(alert["armed"])),
+            ).lastrowid
+
+    def set_alert_states(self, alerts):
+        """Record the debounce state of several alerts in one transaction."""
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("UPDATE alerts SET armed = ?, last_fired = ? WHERE id = ?",
+                                  [(int(alert["armed"]), alert["last_fired"], alert["id"]) for alert in alerts])
+
+    def delete_alerts(self, user_id):
+        with self.lock:
+            self.conn.execute("DELETE FROM alerts WHERE user_id = ?", (user_id,))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def _signal(row):
+    signal = {"symbol": row["symbol"], "timeframe": row["timeframe"]}
+    if row["whale_threshold"] is not None:
+        signal["whale_threshold"] = row["whale_threshold"]
+    return signal
@@ -0,0 +1,110 @@
+"""
+Analysis worker: runs the jobs the API queues in jobs.JobQueue.
+
+    python worker.py [--processes N] [--threads M]
+
+Each process claims jobs and runs up to M at once (fetches are mostly
+waiting on Binance, aggregation uses a core). Run more processes, or more
+containers sharing the data directory, to scale out; set
+ANALYSIS_BACKEND=queue on the API so it hands its analyses to them.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", str(os.cpu_count() or 1)))
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "4"))
+WORKER_POLL = 0.05  # seconds between queue polls when idle
+PURGE_INTERVAL = 60
+
+
+def work(name, threads, stop):
+    """Claim and run jobs until ``stop`` is set, ``threads`` at a time."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent handles Ctrl-C and sets ``stop``
+    # Imported here so the parent process (and spawn start-up) stays light
+    from jobs import JobQueue
+    from tool import analyze_window, fetch_progress, running_volumes
+
+    queue = JobQueue()
+    slots = threading.Semaphore(threads)
+    pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="job")
+
+    def run(job):
+        running = None
+
+        def on_progress(symbol, trades, done, total, whole_window):
+            # Forwarded through the job row to the API's /analyze/stream
+            nonlocal running
+            if whole_window:
+                running = running_volumes(running, trades, job["whale_threshold"])
+            queue.report(job["id"], done, total, running if whole_window else None)
+
+        token = fetch_progress.set(on_progress)
+        try:
+            queue.complete(job["id"], analyze_window(job["symbol"], job["seconds"], job["whale_threshold"]))
+        except Exception as e:
+            queue.complete(job["id"], error=str(e))
+            print(f"[{name}] job {job['id']} ({job['symbol']}) failed: {e}")
+        finally:
+            fetch_progress.reset(token)
+            slots.release()
+
+    print(f"[{name}] ready, {threads} jobs at a time")
+    last_purge = 0.0
+    while not stop.is_set():
+        if time.monotonic() - last_purge > PURGE_INTERVAL:
+            queue.purge()
+            last_purge = time.monotonic()
+        slots.acquire()
+        if stop.is_set():
+            # Stopped while every slot was busy: exit without claiming another job
+            slots.release()
+            break
+        job = queue.claim(name)
+        if job is None:
+            slots.release()
+            stop.wait(WORKER_POLL)
+            continue
+        pool.submit(run, job)
+    pool.shutdown(wait=True)  # finish the jobs already claimed
+    queue.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES)
+    parser.add_argument("--threads", type=int, default=WORKER_THREADS)
+    args = parser.parse_args()
+
+    # Every process has its own rate limiter: split this host's request-weight budget between them
+    budget = int(os.getenv("BINANCE_WEIGHT_PER_MINUTE", "4800"))
+    os.environ["BINANCE_WEIGHT_PER_MINUTE"] = str(max(budget // args.processes, 1))
+
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    host = socket.gethostname()
+    processes = [
+        context.Process(target=work, args=(f"{host}-{i}", args.threads, stop), name=f"worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def shutdown(signum, frame):
+        print("Stopping workers...")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    print(f"🛠 {args.processes} analysis workers running...")
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()